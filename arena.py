@@ -0,0 +1,342 @@
+"""Headless engine-vs-engine matches.
+
+    python arena.py --a depth=4 --b depth=3 --games 1000 --processes 4
+
+Two engine configurations play each other without a window, spread over
+a process pool. Every opening is played twice with the colours swapped,
+so neither engine profits from a lucky start. The run reports wins,
+draws and losses for engine A, an Elo difference with a 95% margin and,
+after every game, a sequential probability ratio test (SPRT) of
+elo0 against elo1 that stops the match as soon as it reaches a verdict.
+With --record FILE, every game is appended to a records.py file.
+
+An engine is given as comma-separated key=value settings:
+    depth   maximum search depth (default: no limit)
+    time    seconds per move (default 1)
+    eval    leaf evaluator, a key of min_max_ai.EVALUATORS
+    table   transposition table size in MB
+    weights JSON file of board_value term weights, as written by tune.py
+            (eval=board_value only)
+"""
+
+import argparse
+import functools
+import math
+import multiprocessing
+import random
+import time
+
+from game import Game, format_move, parse_move
+import records
+from min_max_ai import StateHolder, alpha_beta_minimax, MAX_DEPTH, \
+    EVALUATORS
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable, DEFAULT_SIZE_MB
+from weights import V, read_term_weights
+
+DEFAULT_TIME = 1.0
+DEFAULT_OPENING_PLIES = 6
+# Scores this close to 0 or 1 are clamped so the Elo stays finite.
+SCORE_EPSILON = 1e-6
+
+
+class Engine:
+    """ Search settings of one side of a match. """
+
+    def __init__(self, name, depth=MAX_DEPTH, time_limit=DEFAULT_TIME,
+                 evaluate='board_value', table_size_mb=DEFAULT_SIZE_MB,
+                 weights=None):
+        if evaluate not in EVALUATORS:
+            raise ValueError('unknown evaluator: %s' % evaluate)
+        if weights and evaluate != 'board_value':
+            raise ValueError('weights only apply to eval=board_value, not %s'
+                             % evaluate)
+        self.name = name
+        self.depth = depth
+        self.time_limit = time_limit
+        self.evaluate = evaluate
+        self.table_size_mb = table_size_mb
+        # Term weights read from the file, or None for TERM_WEIGHTS.
+        self.weights = read_term_weights(weights) if weights else None
+
+    def __str__(self):
+        return '%s(depth=%d, time=%g, eval=%s)' % (
+            self.name, self.depth, self.time_limit, self.evaluate)
+
+
+def parse_engine(name, text):
+    """ Engine from a 'depth=4,time=0.5' style string. """
+    keys = {'depth': ('depth', int), 'time': ('time_limit', float),
+            'eval': ('evaluate', str), 'table': ('table_size_mb', float),
+            'weights': ('weights', str)}
+    settings = {}
+    for item in text.split(','):
+        if not item:
+            continue
+        key, _, value = item.partition('=')
+        if key not in keys:
+            raise ValueError('unknown engine setting: %s' % key)
+        attr, convert = keys[key]
+        settings[attr] = convert(value)
+    return Engine(name, **settings)
+
+
+class Player:
+    """ An Engine during one game, with its own table and move statistics
+    kept from move to move. """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table = TranspositionTable(engine.table_size_mb)
+        self.orderer = MoveOrderer(V)
+        self.evaluate = EVALUATORS[engine.evaluate]
+        if engine.weights is not None:
+            self.evaluate = functools.partial(self.evaluate,
+                                              weights=engine.weights)
+
+    def select_move(self, game):
+        state = StateHolder(game.board, game.current_player)
+        return alpha_beta_minimax(state, self.engine.time_limit,
+                                  self.engine.depth, self.table,
+                                  self.orderer, evaluate=self.evaluate)
+
+
+def random_opening(rng, plies):
+    """ plies random legal moves from the start position. """
+    game = Game()
+    game.initialize_board()
+    moves = []
+    while len(moves) < plies and not game.is_game_over():
+        if game.must_pass():
+            game.pass_turn()
+            continue
+        move = rng.choice(game.get_legal_moves())
+        game.make_move(move)
+        moves.append(move)
+    return moves
+
+
+def read_openings(path):
+    """ Openings from a file with one per line, written as moves run
+    together ('f5d6c3'). Blank lines and lines starting with # are
+    skipped. """
+    openings = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            openings.append([parse_move(line[i:i + 2])
+                             for i in range(0, len(line), 2)])
+    return openings
+
+
+def play_game(engines, opening, record_file=None):
+    """ Play one game from opening; engines[0] moves first. Returns the
+    winner's index in engines, or None on a draw. The game is appended
+    to record_file if given. """
+    game = Game()
+    game.initialize_board()
+    for move in opening:
+        if game.must_pass():
+            game.pass_turn()
+        if game.make_move(move) is None:
+            raise ValueError('illegal opening move: %s' % format_move(move))
+    players = [Player(engine) for engine in engines]
+    while not game.is_game_over():
+        if game.must_pass():
+            game.pass_turn()
+            continue
+        move = players[game.current_player].select_move(game)
+        if game.make_move(move) is None:
+            raise RuntimeError('%s played the illegal move %s'
+                               % (engines[game.current_player].name,
+                                  format_move(move)))
+    if record_file is not None:
+        records.append_game(game, record_file)
+    return game.winner()
+
+
+_engines = None
+_record_file = None
+
+
+def _init_worker(engines, record_file=None):
+    global _engines, _record_file
+    _engines = engines
+    _record_file = record_file
+
+
+def _run_game(task):
+    """ Pool task: play one game and return engine A's score in it. """
+    opening, a_first = task
+    a, b = _engines
+    winner = play_game([a, b] if a_first else [b, a], opening,
+                       _record_file)
+    if winner is None:
+        return 0.5
+    return 1.0 if (winner == 0) == a_first else 0.0
+
+
+def elo(score):
+    """ Elo difference for an expected score between 0 and 1. """
+    score = min(max(score, SCORE_EPSILON), 1 - SCORE_EPSILON)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo_diff):
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+
+class Match:
+    """ Running totals of a match from engine A's point of view, with the
+    Elo estimate and the SPRT log-likelihood ratio. """
+
+    def __init__(self, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        return (self.wins + 0.5 * self.draws) / self.games()
+
+    def variance(self):
+        """ Variance of the score of a single game. """
+        n = self.games()
+        s = self.score()
+        return (self.wins + 0.25 * self.draws) / n - s * s
+
+    def elo(self):
+        """ (Elo difference, half-width of its 95% interval). """
+        n = self.games()
+        s = self.score()
+        margin = 1.96 * math.sqrt(max(self.variance(), 0) / n)
+        low = elo(s - margin)
+        high = elo(s + margin)
+        return elo(s), (high - low) / 2
+
+    def llr(self):
+        """ Log-likelihood ratio of elo1 against elo0, using the normal
+        approximation of the score (generalized SPRT). """
+        n = self.games()
+        if n == 0:
+            return 0.0
+        variance = self.variance()
+        if variance <= 0:
+            return 0.0
+        s0 = expected_score(self.elo0)
+        s1 = expected_score(self.elo1)
+        return n * (s1 - s0) * (2 * self.score() - s0 - s1) / (2 * variance)
+
+    def verdict(self):
+        """ 'H1' if A is at least elo1 stronger, 'H0' if it is at most elo0
+        stronger, None while the test is undecided. """
+        llr = self.llr()
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+    def __str__(self):
+        diff, margin = self.elo()
+        return ('games %d  W %d  D %d  L %d  score %.3f  elo %+.1f +- %.1f  '
+                'llr %.2f [%.2f, %.2f]'
+                % (self.games(), self.wins, self.draws, self.losses,
+                   self.score(), diff, margin, self.llr(), self.lower,
+                   self.upper))
+
+
+def run_match(a, b, games, processes=None, openings=None,
+              opening_plies=DEFAULT_OPENING_PLIES, seed=None, match=None,
+              report=None, record_file=None):
+    """ Play up to games games between engines a and b and return the
+    Match. Each opening is played twice, once with each engine first;
+    they come from openings in turn, or are random when it is None. The
+    match ends early once the SPRT has a verdict. report(match) is called
+    after every game, and every game is appended to record_file if
+    given. """
+    if match is None:
+        match = Match()
+    rng = random.Random(seed)
+    tasks = []
+    for i in range((games + 1) // 2):
+        if openings:
+            opening = openings[i % len(openings)]
+        else:
+            opening = random_opening(rng, opening_plies)
+        tasks.append((opening, True))
+        tasks.append((opening, False))
+    tasks = tasks[:games]
+
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                ((a, b), record_file))
+    try:
+        for score in pool.imap_unordered(_run_game, tasks):
+            match.add(score)
+            if report is not None:
+                report(match)
+            if match.verdict() is not None:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Othello engine match')
+    parser.add_argument('--a', default='', help='settings of engine A')
+    parser.add_argument('--b', default='', help='settings of engine B')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--openings', help='file of openings, one per line')
+    parser.add_argument('--opening-plies', type=int,
+                        default=DEFAULT_OPENING_PLIES)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--elo0', type=float, default=0.0)
+    parser.add_argument('--elo1', type=float, default=10.0)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--record', help='game record file to append to')
+    args = parser.parse_args()
+
+    a = parse_engine('A', args.a)
+    b = parse_engine('B', args.b)
+    openings = read_openings(args.openings) if args.openings else None
+    match = Match(args.elo0, args.elo1, args.alpha, args.beta)
+    print('%s vs %s' % (a, b))
+
+    start = time.time()
+    run_match(a, b, args.games, args.processes, openings,
+              args.opening_plies, args.seed, match,
+              lambda m: print(m, flush=True), args.record)
+    verdict = match.verdict()
+    print('-----------')
+    print(match)
+    if verdict == 'H1':
+        print('SPRT: H1 accepted, A is at least %g Elo stronger' % args.elo1)
+    elif verdict == 'H0':
+        print('SPRT: H0 accepted, A is at most %g Elo stronger' % args.elo0)
+    else:
+        print('SPRT: no verdict')
+    print('time %.1f s' % (time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
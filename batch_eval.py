@@ -0,0 +1,206 @@
+"""Batched NumPy version of min_max_ai.board_value.
+
+evaluate_batch scores N positions given as an (N, 8, 8) int8 array
+(0 empty, 1 black, 2 white) in one call, with every term computed as
+array operations over the whole batch. NumPy is optional: available()
+says whether it could be imported, and nothing else here works without
+it.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import bitboard
+import stability
+from weights import V, TERM_WEIGHTS, CORNER_ADJACENT
+
+MOVE_DIRS = [(-1, -1), (-1, 0), (-1, +1),
+             (0, -1),           (0, +1),
+             (+1, -1), (+1, 0), (+1, +1)]
+
+if np is not None:
+    V_ARRAY = np.array(V, dtype=np.int32)
+    CORNER_ROWS = np.array([c[0][0] for c in CORNER_ADJACENT])
+    CORNER_COLS = np.array([c[0][1] for c in CORNER_ADJACENT])
+    ADJACENT_ROWS = np.array([[s[0] for s in c[1]] for c in CORNER_ADJACENT])
+    ADJACENT_COLS = np.array([[s[1] for s in c[1]] for c in CORNER_ADJACENT])
+    BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.int64)
+    INNER_FILES = np.uint64(bitboard.INNER_FILES)
+    BASE3 = np.array(stability.BASE3, dtype=np.intp)
+    EDGE_TABLE = np.array(stability.EDGE_TABLE, dtype=np.uint64)
+    COLUMNS = np.array(stability.COLUMNS, dtype=np.uint64)
+
+
+def available():
+    return np is not None
+
+
+def grids_from_bitboards(blacks, whites):
+    """ (N, 8, 8) int8 grids from sequences of black and white bitboards. """
+    count = len(blacks)
+    bits = np.array([blacks, whites], dtype='<u8').view(np.uint8)
+    bits = np.unpackbits(bits.reshape(2, count, 8), axis=2,
+                         bitorder='little')
+    grids = bits[0] + 2 * bits[1]
+    return grids.astype(np.int8).reshape(count, 8, 8)
+
+
+def shift(a, dr, dc):
+    """ a moved dr rows down and dc columns right on every board,
+    filling the uncovered edge with False. """
+    out = np.zeros_like(a)
+    n = a.shape[1]
+    out[:, max(dr, 0):n + min(dr, 0), max(dc, 0):n + min(dc, 0)] = \
+        a[:, max(-dr, 0):n + min(-dr, 0), max(-dc, 0):n + min(-dc, 0)]
+    return out
+
+
+def pack(a):
+    """ (N, 8, 8) boolean boards as an (N,) array of uint64 bitboards,
+    square (row, col) on bit row * 8 + col as in the bitboard module. """
+    bits = np.packbits(a.reshape(len(a), 64), axis=1, bitorder='little')
+    return bits.view('<u8').reshape(len(a))
+
+
+def popcount(bits):
+    """ Number of set bits of each uint64. """
+    counts = BYTE_COUNTS[bits.view(np.uint8).reshape(len(bits), 8)]
+    return counts.sum(axis=1)
+
+
+def mobility(own, opp):
+    """ Number of legal moves of own on each board, given as uint64
+    bitboards, from the fill of bitboard.get_moves. """
+    return popcount(bitboard.fill_moves(own, opp, INNER_FILES) &
+                    ~(own | opp))
+
+
+def edge_stable(own, opp):
+    """ stability._edge_stable of every board. """
+    def lookup(a, b):
+        return EDGE_TABLE[BASE3[a.astype(np.intp)] +
+                          2 * BASE3[b.astype(np.intp)]]
+
+    def column(bits):
+        return (bits & stability.A_FILE) * np.uint64(
+            stability.COLUMN_MAGIC) >> np.uint64(56)
+
+    stable = lookup(own & 0xff, opp & 0xff)
+    stable |= lookup(own >> 56, opp >> 56) << np.uint64(56)
+    stable |= COLUMNS[lookup(column(own), column(opp)).astype(np.intp)]
+    stable |= COLUMNS[lookup(column(own >> 7), column(opp >> 7))
+                      .astype(np.intp)] << np.uint64(7)
+    return stable
+
+
+def stable_counts(own, opp):
+    """ Numbers of stable discs of own and of opp on every board, as
+    stability.Stability.stable_discs finds them, with the spreading
+    repeated until no board gains a disc. """
+    finder = stability.stability(bitboard.geometry(bitboard.N))
+    full = finder.full_lines(own | opp)
+    covered = [f | np.uint64(edge) for f, edge in zip(full, finder.edges)]
+    seeds = edge_stable(own, opp) | \
+        (covered[0] & covered[1] & covered[2] & covered[3])
+    corners = ((own | opp) & np.uint64(bitboard.CORNERS)) != 0
+    counts = []
+    for discs in (own, opp):
+        stable = discs & seeds
+        while True:
+            new = discs.copy()
+            for (shift, up, down), line in zip(finder.steps, covered):
+                shift = np.uint64(shift)
+                new &= line | (stable & np.uint64(up)) << shift | \
+                    (stable & np.uint64(down)) >> shift
+            new |= stable
+            if (new == stable).all():
+                break
+            stable = new
+        counts.append(np.where(corners, popcount(stable), 0))
+    return counts[0], counts[1]
+
+
+def ratio(a, b):
+    """ board_value's share term: +100 * a / (a + b) when a leads,
+    -100 * b / (a + b) when b leads, 0 on a tie. """
+    total = np.maximum(a + b, 1)
+    return np.where(a > b, 100.0 * a / total,
+                    np.where(a < b, -100.0 * b / total, 0.0))
+
+
+def features(grids, players):
+    """ The seven board_value terms of every board, from the point of view
+    of players (0 or 1 per board), as a dict of length-N arrays. """
+    grids = np.asarray(grids)
+    own_tile = (np.asarray(players) + 1).reshape(-1, 1, 1)
+    empty = grids == 0
+    own = grids == own_tile
+    opp = ~empty & ~own
+
+    own_bits = pack(own)
+    opp_bits = pack(opp)
+
+    player_num = own.sum(axis=(1, 2))
+    enemy_num = opp.sum(axis=(1, 2))
+    positional = (own * V_ARRAY).sum(axis=(1, 2)) - \
+                 (opp * V_ARRAY).sum(axis=(1, 2))
+
+    near_empty = np.zeros_like(empty)
+    for dr, dc in MOVE_DIRS:
+        near_empty |= shift(empty, dr, dc)
+    player_front = (own & near_empty).sum(axis=(1, 2))
+    enemy_front = (opp & near_empty).sum(axis=(1, 2))
+
+    corner_own = own[:, CORNER_ROWS, CORNER_COLS]
+    corner_opp = opp[:, CORNER_ROWS, CORNER_COLS]
+    corner_empty = empty[:, CORNER_ROWS, CORNER_COLS][:, :, None]
+    adjacent_own = (own[:, ADJACENT_ROWS, ADJACENT_COLS] & corner_empty)
+    adjacent_opp = (opp[:, ADJACENT_ROWS, ADJACENT_COLS] & corner_empty)
+    own_stable, opp_stable = stable_counts(own_bits, opp_bits)
+
+    return {
+        'piece': ratio(player_num, enemy_num),
+        'corner': 25.0 * (corner_own.sum(axis=1) - corner_opp.sum(axis=1)),
+        'corner_adjacent': -12.5 * (adjacent_own.sum(axis=(1, 2)) -
+                                    adjacent_opp.sum(axis=(1, 2))),
+        'mobility': ratio(mobility(own_bits, opp_bits),
+                          mobility(opp_bits, own_bits)),
+        'frontier': -ratio(player_front, enemy_front),
+        'positional': positional.astype(np.float64),
+        'stability': ratio(own_stable, opp_stable),
+    }
+
+
+def evaluate_batch(grids, players, weights=None):
+    """ board_value of every board in grids for the matching player. """
+    if weights is None:
+        weights = TERM_WEIGHTS
+    terms = features(grids, players)
+    score = np.zeros(len(terms['piece']))
+    for name, values in terms.items():
+        score += weights[name] * values
+    return score
+
+
+def child_values(own, opp, player, squares):
+    """ Value for player of each move in squares, where own and opp are the
+    bitboards of player and of the opponent: minus board_value of the
+    position after the move, evaluated for all moves in one batch. """
+    blacks = []
+    whites = []
+    for sq in squares:
+        flips = bitboard.get_flips(own, opp, sq)
+        mover = own | flips | (1 << sq)
+        other = opp ^ flips
+        if player == 0:
+            blacks.append(mover)
+            whites.append(other)
+        else:
+            blacks.append(other)
+            whites.append(mover)
+    grids = grids_from_bitboards(blacks, whites)
+    players = np.full(len(squares), 1 - player)
+    return -evaluate_batch(grids, players)
@@ -0,0 +1,320 @@
+"""Move generator and fixed-position search benchmarks.
+
+    python benchmark.py perft [--depth D] [--generator G] [--json PATH]
+        Count the positions reached in exactly D plies (a pass is a ply)
+        from the start position and from the PERFT positions, check the
+        counts against the known ones and report positions per second. G
+        is 'bitboard' (StateHolder, used by the search), 'game' (the
+        game.Game move generator) or 'both', which also checks that the
+        two agree.
+
+    python benchmark.py search [--depth D] [--json PATH]
+        Search a fixed set of positions to depth D and report the nodes
+        searched, the time taken and the best move for each, so search
+        changes can be compared on the same work. With --json, the
+        search_stats record of each position is appended to PATH.
+
+    python benchmark.py smp [--workers N] [--depth D]
+        Time-to-depth of the Lazy SMP search on the same positions with
+        1, 2, ... N worker processes.
+
+    python benchmark.py endgame [--json PATH]
+        Solve the ENDGAME positions exactly and report the nodes, time,
+        best move and final score of each.
+
+Every --json record carries the benchmark name, position, host and the
+git commit of the tree, so files from different commits can be compared
+line by line.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import bitboard
+from endgame import EndgameSolver
+from game import Game, format_move
+from min_max_ai import StateHolder, fixed_depth_search
+from search_stats import SearchStats
+import parallel
+
+DEFAULT_DEPTH = 6
+DEFAULT_PERFT_DEPTH = 6
+
+# Black to move in every position; 'X' is black, 'O' white, '-' empty.
+POSITIONS = [
+    '--------------------X-X----OOOO----OX------OOX----XO--X---------',
+    '----------O-------O-O-----OXOO--OOOOO-------XXX-----XX-----X----',
+    '----O-------O-----OOOX---OOOXX----OXOX---O-OX-X-O---OX----------',
+    '------O----O-XXX---OOOOO--XXXO----XXXOO---XX-X----XX--X----X----',
+    '-----O-----OOO-O--XOXOOO-XOXXOXO-O-XOX-O---XXOO----XO-X---------',
+    'X-XX----OOXXXX--OOXOOX---O-XXOX-X-OOOOOO--OO-OXO-O----O---------',
+    '-OOOOO--OOOXO-XXXOOXXOX--OOXOXX--O-XX-X---OXOOO--O---OO-------O-',
+    'O----OX--OOOOX--O-XOOXX-XXXOOX-X--XOXXX--OXOOXX-OOOOOO--XO-X-O--',
+]
+
+START = '---------------------------OX------XO---------------------------'
+
+# Black to move: positions to solve exactly, with 12 to 16 empties.
+ENDGAME = [
+    'O-X---O-XXXX-O--XXXXOOOOXXXOXO-OXXXXXOOOXXXXOOOOO-XOOOOO--OOOOOO',
+    'XXXX-X--O-XXOX---XXOOXX-XXOXOX--XOXOOOX-OOOOXXXXOOXXOOO-OOOOOOO-',
+    '-XO-O---X-OOXOOOXXOXOOXXX-XXOXOOXX-XXXOO-XOOXXOX--XXOOXX--XX-OOX',
+    'XOOOOO-O-OOOOO-OOOOOOOOOXO-XOOO-OOOOXXOX-OOOOOXX-O-OOXXX---O---X',
+    '-OO-----XXXXXXXXXOXXOOOOOOXXOOO-OOOOXOO--OXX-X-OOOOOOOX-XXX-X---',
+]
+
+# (name, position, counts at depth 1, 2, ...) of the perft positions,
+# black to move. The start position counts are the published ones; the
+# others were counted by both move generators, to depth 5 for game.Game.
+# endgame-1 passes 137 times in 7 plies.
+PERFT = [
+    ('start', START,
+     [4, 12, 56, 244, 1396, 8200, 55092, 390216, 3005288]),
+    ('middle-4', POSITIONS[4],
+     [15, 216, 3029, 39750, 533350, 6593960]),
+    ('endgame-0', ENDGAME[0],
+     [5, 24, 120, 554, 2500, 10734, 39027]),
+    ('endgame-1', ENDGAME[1],
+     [5, 48, 242, 1870, 9039, 54724, 231254]),
+]
+
+
+def parse_position(text, player=0):
+    """ StateHolder for a 64-character board string. """
+    grid = [['-XO'.index(text[row * 8 + col]) for col in range(8)]
+            for row in range(8)]
+    return StateHolder(grid, player)
+
+
+def git_commit():
+    """ Commit of the tree benchmark.py is in, or None. """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def base_record(benchmark, position):
+    return {'benchmark': benchmark, 'position': position,
+            'commit': git_commit(), 'time': time.time(),
+            'host': socket.gethostname(),
+            'python': platform.python_version()}
+
+
+def write_record(path, record):
+    """ Append record to path as one JSON line. """
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def perft(board, depth):
+    """ Positions reached from a StateHolder in exactly depth plies, a
+    pass counting as a ply. A finished game counts as one position
+    whatever depth is left. """
+    if depth == 0:
+        return 1
+    moves = board.get_move_mask()
+    if not moves:
+        board.pass_turn()
+        if board.has_legal_move():
+            count = perft(board, depth - 1)
+        else:
+            count = 1
+        board.unmake_move()
+        return count
+    if depth == 1:
+        return bitboard.popcount(moves)
+    count = 0
+    for sq in bitboard.iter_squares(moves):
+        board.make_move(sq)
+        count += perft(board, depth - 1)
+        board.unmake_move()
+    return count
+
+
+def game_from_text(text, player=0):
+    """ game.Game for a 64-character board string. """
+    game = Game(8)
+    for sq, c in enumerate(text):
+        if c != '-':
+            game.board[sq // 8][sq % 8] = '-XO'.index(c)
+    game.num_tiles = [text.count('X'), text.count('O')]
+    for sq, c in enumerate(text):
+        if c != '-':
+            game.add_candidates((sq // 8, sq % 8))
+    game.current_player = player
+    return game
+
+
+def perft_game(game, depth):
+    """ perft with the game.Game move generator, copying the game for
+    every move since it cannot take moves back. """
+    if depth == 0:
+        return 1
+    moves = game.get_legal_moves()
+    if not moves:
+        if not game.get_legal_moves(1 - game.current_player):
+            return 1
+        child = copy.deepcopy(game)
+        child.pass_turn()
+        return perft_game(child, depth - 1)
+    if depth == 1:
+        return len(moves)
+    count = 0
+    for move in moves:
+        child = copy.deepcopy(game)
+        child.make_move(move)
+        count += perft_game(child, depth - 1)
+    return count
+
+
+def run_perft(depth, generator='bitboard', json_path=None):
+    """ Perft of every PERFT position to depth with the generator(s) given;
+    return False if any count is wrong. """
+    generators = ['bitboard', 'game'] if generator == 'both' else [generator]
+    ok = True
+    for name, text, known in PERFT:
+        counts = {}
+        for gen in generators:
+            start = time.perf_counter()
+            if gen == 'game':
+                count = perft_game(game_from_text(text), depth)
+            else:
+                count = perft(parse_position(text), depth)
+            elapsed = time.perf_counter() - start
+            counts[gen] = count
+            expected = known[depth - 1] if depth <= len(known) else None
+            correct = expected is None or count == expected
+            ok = ok and correct
+            if expected is None:
+                check = 'unchecked'
+            elif correct:
+                check = 'ok'
+            else:
+                check = 'WRONG, expected %d' % expected
+            print('%-10s %-8s depth %d  positions %10d  time %7.3f  '
+                  'pps %9d  %s'
+                  % (name, gen, depth, count, elapsed, count / elapsed,
+                     check))
+            if json_path:
+                record = base_record('perft', name)
+                record.update({'generator': gen, 'depth': depth,
+                               'positions': count, 'elapsed': elapsed,
+                               'pps': count / elapsed, 'expected': expected,
+                               'correct': correct})
+                write_record(json_path, record)
+        if len(set(counts.values())) > 1:
+            print('%-10s generators disagree: %s' % (name, counts))
+            ok = False
+    return ok
+
+
+def run_search(depth, json_path=None):
+    total_nodes = 0
+    total_time = 0
+    for i, text in enumerate(POSITIONS):
+        board = parse_position(text)
+        stats = SearchStats() if json_path else None
+        start = time.perf_counter()
+        move, value, nodes = fixed_depth_search(board, depth, stats)
+        elapsed = time.perf_counter() - start
+        if stats is not None:
+            stats.info.update({'benchmark': 'search', 'position': i,
+                               'commit': git_commit(), 'depth': depth})
+            stats.write(json_path)
+        total_nodes += nodes
+        total_time += elapsed
+        print('position %d  depth %d  nodes %9d  time %7.3f  move %s'
+              % (i, depth, nodes, elapsed, move))
+    print('total  nodes %d  time %.3f  nps %d'
+          % (total_nodes, total_time, total_nodes / total_time))
+
+
+def run_endgame(json_path=None):
+    solver = EndgameSolver()
+    total_nodes = 0
+    total_time = 0
+    for i, text in enumerate(ENDGAME):
+        board = parse_position(text)
+        solver.clear()
+        nodes = solver.nodes
+        start = time.perf_counter()
+        sq, score = solver.solve(*board.discs)
+        elapsed = time.perf_counter() - start
+        nodes = solver.nodes - nodes
+        move = format_move(bitboard.coord(sq)) if sq >= 0 else 'pass'
+        total_nodes += nodes
+        total_time += elapsed
+        print('position %d  empties %2d  nodes %9d  time %7.3f  move %-4s  '
+              'score %+d' % (i, text.count('-'), nodes, elapsed, move, score))
+        if json_path:
+            record = base_record('endgame', i)
+            record.update({'empties': text.count('-'), 'nodes': nodes,
+                           'elapsed': elapsed, 'nps': nodes / elapsed,
+                           'move': move, 'score': score})
+            write_record(json_path, record)
+    print('total  nodes %d  time %.3f  nps %d'
+          % (total_nodes, total_time, total_nodes / total_time))
+
+
+def run_smp(max_workers, depth):
+    """ Time for 1 .. max_workers processes to finish depth on every
+    position. """
+    for workers in range(1, max_workers + 1):
+        search = parallel.ParallelSearch(workers)
+        total_time = 0
+        reached = []
+        for text in POSITIONS:
+            board = parse_position(text)
+            start = time.perf_counter()
+            move, finished = search.search(board, float('inf'), depth)
+            total_time += time.perf_counter() - start
+            reached.append(finished)
+        search.close()
+        print('workers %2d  depth %d  time-to-depth %7.3f  reached %s'
+              % (workers, depth, total_time, reached))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Othello search benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    search = commands.add_parser('search')
+    search.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    search.add_argument('--json', help='file to append statistics to')
+    smp = commands.add_parser('smp')
+    smp.add_argument('--workers', type=int, default=4)
+    smp.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    perft_parser = commands.add_parser('perft')
+    perft_parser.add_argument('--depth', type=int,
+                              default=DEFAULT_PERFT_DEPTH)
+    perft_parser.add_argument('--generator', default='bitboard',
+                              choices=['bitboard', 'game', 'both'])
+    perft_parser.add_argument('--json', help='file to append results to')
+    endgame = commands.add_parser('endgame')
+    endgame.add_argument('--json', help='file to append results to')
+    args = parser.parse_args()
+
+    if args.command == 'smp':
+        run_smp(args.workers, args.depth)
+    elif args.command == 'perft':
+        if not run_perft(args.depth, args.generator, args.json):
+            sys.exit(1)
+    elif args.command == 'endgame':
+        run_endgame(args.json)
+    else:
+        run_search(getattr(args, 'depth', DEFAULT_DEPTH),
+                   getattr(args, 'json', None))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""Bitboard helpers for the 8x8 Othello engine.
+
+A position is held as two 64-bit integers, one per player. Square
+(row, col) maps to bit row * 8 + col, so iterating the set bits from the
+lowest one up visits squares in the same row-major order as the grid.
+"""
+
+N = 8
+FULL = (1 << 64) - 1
+
+# Masks that drop the squares a shift would wrap onto the next row.
+NOT_A_FILE = 0xfefefefefefefefe
+NOT_H_FILE = 0x7f7f7f7f7f7f7f7f
+# Opponent discs that can sit inside a horizontal or diagonal run.
+INNER_FILES = 0x7e7e7e7e7e7e7e7e
+
+# (shift, run mask) for each pair of opposite directions: east/west,
+# south/north, south-west/north-east and south-east/north-west.
+DIRECTIONS = [(1, INNER_FILES), (8, FULL), (7, INNER_FILES), (9, INNER_FILES)]
+
+# (shift, source mask) pairs used to step every disc one square towards
+# higher and towards lower squares without wrapping.
+LEFT_STEPS = [(1, NOT_H_FILE), (8, FULL), (7, NOT_A_FILE), (9, NOT_H_FILE)]
+RIGHT_STEPS = [(1, NOT_A_FILE), (8, FULL), (7, NOT_H_FILE), (9, NOT_A_FILE)]
+
+# Both players' discs can be filled at once, packed into one integer with
+# the second player PAIR_SHIFT bits up: far enough that no shift of the
+# fill carries a disc from one half into the other. PAIRED_INNER_FILES is
+# INNER_FILES repeated for the upper half.
+PAIR_SHIFT = 128
+PAIRED_INNER_FILES = INNER_FILES | INNER_FILES << PAIR_SHIFT
+
+CORNERS = (1 << 0) | (1 << 7) | (1 << 56) | (1 << 63)
+
+
+def square(row, col):
+    """ Bit index of the square (row, col). """
+    return row * N + col
+
+
+def coord(sq):
+    """ (row, col) of the bit index sq. """
+    return divmod(sq, N)
+
+
+popcount = int.bit_count
+
+
+def iter_squares(bits):
+    """ Yield the indices of the set bits, lowest first. """
+    while bits:
+        lsb = bits & -bits
+        yield lsb.bit_length() - 1
+        bits ^= lsb
+
+
+def from_grid(grid):
+    """ Convert a list-of-lists board (0 empty, 1 black, 2 white) into a
+    (black, white) pair of bitboards. """
+    black = white = 0
+    bit = 1
+    for row in grid:
+        for cell in row:
+            if cell == 1:
+                black |= bit
+            elif cell == 2:
+                white |= bit
+            bit <<= 1
+    return black, white
+
+
+def to_grid(black, white):
+    """ Inverse of from_grid. """
+    grid = [[0] * N for i in range(N)]
+    for sq in iter_squares(black):
+        grid[sq // N][sq % N] = 1
+    for sq in iter_squares(white):
+        grid[sq // N][sq % N] = 2
+    return grid
+
+
+def fill_moves(own, opp, inner=INNER_FILES):
+    """ Squares where own outflanks a run of opp discs, and maybe some
+    squares of opp too: the caller keeps only the empty ones.
+
+    Each direction but east is a Kogge-Stone fill: after the first step
+    every run of opponent discs is extended two and then four squares at
+    a time, which covers the longest possible run of six. Towards east,
+    adding the first disc of each run to the run carries past its end.
+    inner is INNER_FILES with the layout of own and opp: they may hold
+    both players packed PAIR_SHIFT bits apart, or be NumPy arrays of
+    uint64 bitboards.
+    """
+    inner &= opp
+    moves = (inner + (inner & (own << 1))) & ~inner
+    pairs = inner & (inner >> 1)
+    x = inner & (own >> 1)
+    x |= inner & (x >> 1)
+    x |= pairs & (x >> 2)
+    x |= pairs & (x >> 2)
+    moves |= x >> 1
+    pairs = opp & (opp << 8)
+    x = opp & (own << 8)
+    x |= opp & (x << 8)
+    x |= pairs & (x << 16)
+    x |= pairs & (x << 16)
+    moves |= x << 8
+    pairs = opp & (opp >> 8)
+    x = opp & (own >> 8)
+    x |= opp & (x >> 8)
+    x |= pairs & (x >> 16)
+    x |= pairs & (x >> 16)
+    moves |= x >> 8
+    pairs = inner & (inner << 7)
+    x = inner & (own << 7)
+    x |= inner & (x << 7)
+    x |= pairs & (x << 14)
+    x |= pairs & (x << 14)
+    moves |= x << 7
+    pairs = inner & (inner >> 7)
+    x = inner & (own >> 7)
+    x |= inner & (x >> 7)
+    x |= pairs & (x >> 14)
+    x |= pairs & (x >> 14)
+    moves |= x >> 7
+    pairs = inner & (inner << 9)
+    x = inner & (own << 9)
+    x |= inner & (x << 9)
+    x |= pairs & (x << 18)
+    x |= pairs & (x << 18)
+    moves |= x << 9
+    pairs = inner & (inner >> 9)
+    x = inner & (own >> 9)
+    x |= inner & (x >> 9)
+    x |= pairs & (x >> 18)
+    x |= pairs & (x >> 18)
+    moves |= x >> 9
+    return moves
+
+
+def get_moves(own, opp):
+    """ Bitboard of the empty squares where own can play. """
+    return fill_moves(own, opp) & ~(own | opp) & FULL
+
+
+def _rays(sq, steps):
+    """ (line, nearest square) bitboards of the lines from sq (excluded)
+    to the edge of the board along each (row step, column step) of steps
+    that hold two squares or more: the lines where a move on sq can flip
+    discs. """
+    rays = []
+    for row_step, col_step in steps:
+        row, col = coord(sq)
+        line = nearest = 0
+        while 0 <= row + row_step < N and 0 <= col + col_step < N:
+            row += row_step
+            col += col_step
+            line |= 1 << square(row, col)
+            nearest = nearest or line
+        if popcount(line) >= 2:
+            rays.append((line, nearest))
+    return rays
+
+
+# The rays of each square towards higher and towards lower squares.
+UP_RAYS = [_rays(sq, [(0, 1), (1, -1), (1, 0), (1, 1)]) for sq in range(64)]
+DOWN_RAYS = [_rays(sq, [(0, -1), (-1, 1), (-1, 0), (-1, -1)])
+             for sq in range(64)]
+
+
+def get_flips(own, opp, sq):
+    """ Bitboard of the opponent discs flipped when own plays on sq. """
+    flips = 0
+    # Along a line the discs of opp next to sq are flipped when the first
+    # other square is own's: the lowest such square of a line towards
+    # higher squares, the highest of one towards lower squares.
+    for line, nearest in UP_RAYS[sq]:
+        if opp & nearest:
+            first = line & ~opp
+            first &= -first
+            if first & own:
+                flips |= (first - 1) & line
+    for line, nearest in DOWN_RAYS[sq]:
+        if opp & nearest:
+            first = (line & ~opp).bit_length() - 1
+            if first >= 0 and own >> first & 1:
+                flips |= (line >> (first + 1)) << (first + 1)
+    return flips
+
+
+def move_counts(own, opp):
+    """ (moves of own, moves of opp), from one fill of both players'
+    discs packed together. """
+    moves = fill_moves(own | opp << PAIR_SHIFT, opp | own << PAIR_SHIFT,
+                       PAIRED_INNER_FILES)
+    empty = ~(own | opp) & FULL
+    return popcount(moves & empty), popcount(moves >> PAIR_SHIFT & empty)
+
+
+def mobility(own, opp):
+    """ (moves of own, moves of opp, potential moves of own, potential
+    moves of opp).
+
+    A potential move of own is an empty square next to a disc of opp,
+    where own may be able to play later.
+    """
+    own_moves, opp_moves = move_counts(own, opp)
+    empty = ~(own | opp) & FULL
+    return (own_moves, opp_moves, popcount(neighbours(opp) & empty),
+            popcount(neighbours(own) & empty))
+
+
+def neighbours(bits):
+    """ Bitboard of every square adjacent to a set bit of bits. """
+    # The squares beside bits, then those above and below bits or them.
+    east = (bits & NOT_H_FILE) << 1
+    west = (bits & NOT_A_FILE) >> 1
+    row = bits | east | west
+    return (east | west | row << 8 | row >> 8) & FULL
+
+
+class Geometry:
+    """ Bitboard layout of an n x n board: square (row, col) is bit
+    row * n + col of an integer of n * n bits, with the masks and moves of
+    the functions above worked out for that width.
+
+    The 8 x 8 geometry uses the unrolled module functions; other sizes use
+    a Kogge-Stone fill with as many doubling steps as the longest run of
+    opponent discs needs.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.squares = n * n
+        self.full = (1 << self.squares) - 1
+        first_col = 0
+        for row in range(n):
+            first_col |= 1 << (row * n)
+        last_col = first_col << (n - 1)
+        self.not_first_col = self.full ^ first_col
+        self.not_last_col = self.full ^ last_col
+        inner = self.not_first_col & self.not_last_col
+        self.directions = [(1, inner), (n, self.full), (n - 1, inner),
+                           (n + 1, inner)]
+        self.left_steps = [(1, self.not_last_col), (n, self.full),
+                           (n - 1, self.not_first_col),
+                           (n + 1, self.not_last_col)]
+        self.right_steps = [(1, self.not_first_col), (n, self.full),
+                            (n - 1, self.not_last_col),
+                            (n + 1, self.not_first_col)]
+        last = n - 1
+        self.corners = 0
+        for row, col in ((0, 0), (0, last), (last, 0), (last, last)):
+            self.corners |= 1 << self.square(row, col)
+        # Doubling steps of the fill: runs of up to 2 ** k - 1 discs.
+        self.fill_steps = max(1, (n - 2).bit_length())
+        if n == N:
+            self.get_moves = get_moves
+            self.get_flips = get_flips
+            self.move_counts = move_counts
+            self.mobility = mobility
+            self.neighbours = neighbours
+
+    def square(self, row, col):
+        return row * self.n + col
+
+    def coord(self, sq):
+        return divmod(sq, self.n)
+
+    def from_grid(self, grid):
+        """ (black, white) bitboards of a list-of-lists board. """
+        black = white = 0
+        bit = 1
+        for row in grid:
+            for cell in row:
+                if cell == 1:
+                    black |= bit
+                elif cell == 2:
+                    white |= bit
+                bit <<= 1
+        return black, white
+
+    def to_grid(self, black, white):
+        n = self.n
+        grid = [[0] * n for i in range(n)]
+        for sq in iter_squares(black):
+            grid[sq // n][sq % n] = 1
+        for sq in iter_squares(white):
+            grid[sq // n][sq % n] = 2
+        return grid
+
+    def get_moves(self, own, opp):
+        """ Bitboard of the empty squares where own can play. """
+        moves = 0
+        steps = self.fill_steps
+        for shift, run in self.directions:
+            mask = opp & run
+            # Discs of own extended through the runs of opponent discs.
+            fill = own
+            through = mask
+            step = shift
+            for i in range(steps):
+                fill |= through & (fill << step)
+                through &= through << step
+                step += step
+            moves |= (fill & mask) << shift
+            fill = own
+            through = mask
+            step = shift
+            for i in range(steps):
+                fill |= through & (fill >> step)
+                through &= through >> step
+                step += step
+            moves |= (fill & mask) >> shift
+        return moves & ~(own | opp) & self.full
+
+    def get_flips(self, own, opp, sq):
+        """ Bitboard of the opponent discs flipped when own plays on sq. """
+        move = 1 << sq
+        flips = 0
+        for shift, run in self.directions:
+            mask = opp & run
+            x = mask & (move << shift)
+            while x and not own & (x << shift):
+                step = mask & (x << shift)
+                if step & x == step:
+                    x = 0
+                else:
+                    x |= step
+            flips |= x
+            x = mask & (move >> shift)
+            while x and not own & (x >> shift):
+                step = mask & (x >> shift)
+                if step & x == step:
+                    x = 0
+                else:
+                    x |= step
+            flips |= x
+        return flips
+
+    def move_counts(self, own, opp):
+        """ (moves of own, moves of opp). """
+        return popcount(self.get_moves(own, opp)), \
+            popcount(self.get_moves(opp, own))
+
+    def mobility(self, own, opp):
+        """ (moves of own, moves of opp, potential moves of own, potential
+        moves of opp), as the module function counts them. """
+        empty = ~(own | opp) & self.full
+        return self.move_counts(own, opp) + \
+            (popcount(self.neighbours(opp) & empty),
+             popcount(self.neighbours(own) & empty))
+
+    def neighbours(self, bits):
+        """ Bitboard of every square adjacent to a set bit of bits. """
+        result = 0
+        for shift, mask in self.left_steps:
+            result |= (bits & mask) << shift
+        for shift, mask in self.right_steps:
+            result |= (bits & mask) >> shift
+        return result & self.full
+
+
+_geometries = {}
+
+
+def geometry(n):
+    """ The shared Geometry of an n x n board. """
+    if n not in _geometries:
+        _geometries[n] = Geometry(n)
+    return _geometries[n]
@@ -19,6 +19,9 @@ class Board:
         self.tile_size = TILE
         self.tile_colors = TILE_COLORS
         self.move = ()
+        # Canvas oval of every square that has held a disc; a flip recolors
+        # it instead of drawing a new one.
+        self.tiles = {}
 
     def draw_board(self):
    
@@ -26,6 +29,8 @@ class Board:
                     self.n * self.square_size + self.square_size)
         turtle.screensize(self.n * self.square_size, self.n * self.square_size)
         turtle.bgcolor('white')
+        # No animation: the screen is redrawn once per update() call.
+        turtle.tracer(0)
 
        
         othello = turtle.Turtle(visible = False)
@@ -58,6 +63,7 @@ class Board:
         for i in range(self.n + 1):
             othello.setposition(self.square_size * i + corner, corner)
             self.draw_lines(othello)
+        turtle.update()
 
     def draw_lines(self, turt):
       
@@ -95,8 +101,9 @@ class Board:
         else:
             self.move = ()
 
-    def get_tile_start_pos(self, square):
-       
+    def get_tile_center(self, square):
+        """ Screen position of the centre of square, or () if it is off the
+        board. """
         if square == ():
             return ()
         
@@ -104,46 +111,33 @@ class Board:
             if square[i] not in range(self.n):
                 return ()
 
-        row, col = square[0], square[1]
-
-        y = ((self.n - 1) / 2 - row) * self.square_size
-        if col < self.n / 2:
-            x = (col - (self.n - 1) / 2) * self.square_size - self.tile_size
-            r = - self.tile_size
-        else:
-            x = (col - (self.n - 1) / 2) * self.square_size + self.tile_size
-            r = self.tile_size
-        
-        return ((x, y), r)
+        x = (square[1] - (self.n - 1) / 2) * self.square_size
+        y = ((self.n - 1) / 2 - square[0]) * self.square_size
+        return (x, y)
 
     def draw_tile(self, square, color):
-        
-        pos = self.get_tile_start_pos(square)
-        if pos:
-            coord = pos[0]
-            r = pos[1]
-        else:
+        """ Show a disc of color on square. Nothing appears until the next
+        update(), so a move and all its flips are drawn at once. """
+        center = self.get_tile_center(square)
+        if not center:
             print('Error drawing the tile...')
             return
-        
-       
-        tile = turtle.Turtle(visible = False)
-        tile.penup()
-        tile.speed(0)
-        tile.hideturtle()
 
-      
-        tile.color(self.tile_colors[color])
+        fill = self.tile_colors[color]
+        canvas = turtle.getcanvas()
+        tile = self.tiles.get(square)
+        if tile is None:
+            # The turtle canvas has y pointing down.
+            x, y = center[0], -center[1]
+            r = self.tile_size
+            self.tiles[square] = canvas.create_oval(x - r, y - r, x + r, y + r,
+                                                    fill=fill, outline=fill)
+        else:
+            canvas.itemconfig(tile, fill=fill, outline=fill)
 
-    
-        tile.setposition(coord)
-        tile.setheading(90)
-        
-       
-        tile.begin_fill()
-        tile.pendown()
-        tile.circle(r)
-        tile.end_fill()
+    def update(self):
+        """ Draw the tiles changed since the last update. """
+        turtle.update()
 
     def __str__(self):
        
@@ -0,0 +1,249 @@
+"""Opening book: best moves of early positions, searched offline.
+
+    python book.py build [--plies P] [--depth D] [--out book.bin]
+        Search every position reachable in P plies from the start to depth
+        D and write the book.
+
+    python book.py show [--book book.bin]
+        Print the number of entries and the book move of the start
+        position.
+
+The file is an 8-byte header (magic and entry count) followed by fixed
+12-byte records: the position's Zobrist key, its score and the book
+move's square, sorted by key. Only one of each set of symmetric positions
+is stored; lookups try every symmetry, and the colours swapped for games
+where white moves first. OpeningBook maps it read-only with mmap and
+binary-searches it, so opening a book costs nothing and every process
+that uses the same file shares its pages.
+"""
+
+import argparse
+import copy
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+import bitboard
+from min_max_ai import StateHolder, fixed_depth_search
+import transposition
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'book.bin')
+MAGIC = b'OBK1'
+HEADER = struct.Struct('<4sI')
+# Zobrist key, score (rounded, clamped to 16 bits), move square.
+RECORD = struct.Struct('<QhBx')
+KEY = struct.Struct('<Q')
+DEFAULT_PLIES = 4
+DEFAULT_DEPTH = 8
+
+
+
+def _symmetries():
+    """ The eight symmetries of the board, each as a list giving the image
+    of every square. """
+    symmetries = []
+    for transpose in (False, True):
+        for flip_rows in (False, True):
+            for flip_cols in (False, True):
+                images = []
+                for sq in range(64):
+                    row, col = bitboard.coord(sq)
+                    if transpose:
+                        row, col = col, row
+                    if flip_rows:
+                        row = 7 - row
+                    if flip_cols:
+                        col = 7 - col
+                    images.append(bitboard.square(row, col))
+                symmetries.append(images)
+    return symmetries
+
+
+SYMMETRIES = _symmetries()
+
+
+def transform(bits, symmetry):
+    """ bits with every square moved to its image under symmetry. """
+    out = 0
+    for sq in bitboard.iter_squares(bits):
+        out |= 1 << symmetry[sq]
+    return out
+
+
+def canonical_key(black, white, player):
+    """ Smallest key among the symmetric images of a position. """
+    return min(transposition.hash_position(transform(black, symmetry),
+                                           transform(white, symmetry),
+                                           player)
+               for symmetry in SYMMETRIES)
+
+
+class OpeningBook:
+    """ Read-only view of a book file. """
+
+    def __init__(self, path=BOOK_PATH):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or \
+           len(self.map) != HEADER.size + self.count * RECORD.size:
+            self.map.close()
+            raise ValueError('%s is not an opening book' % path)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """ (square, score) stored for key, or None. """
+        book = self.map
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            offset = HEADER.size + mid * RECORD.size
+            mid_key = KEY.unpack_from(book, offset)[0]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                key, score, sq = RECORD.unpack_from(book, offset)
+                return sq, score
+        return None
+
+    def lookup(self, state):
+        """ Book move (row, col) for a min_max_ai.StateHolder, or None if
+        the position is not in the book. The book is built with black
+        moving first; a game where white starts is looked up with the
+        colours swapped. """
+        black, white = state.discs
+        player = state.current_player
+        for black, white, player in ((black, white, player),
+                                     (white, black, 1 - player)):
+            for symmetry in SYMMETRIES:
+                entry = self.find(transposition.hash_position(
+                    transform(black, symmetry), transform(white, symmetry),
+                    player))
+                if entry is None:
+                    continue
+                sq = symmetry.index(entry[0])
+                if not state.get_move_mask() >> sq & 1:
+                    # A key collision can in principle give a move that is
+                    # illegal here; treat it as a miss.
+                    break
+                self.hits += 1
+                return bitboard.coord(sq)
+        self.misses += 1
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+def open_book(path=BOOK_PATH):
+    """ OpeningBook for path, or None if there is no usable book there. """
+    try:
+        return OpeningBook(path)
+    except (OSError, ValueError):
+        return None
+
+
+def start_position():
+    board = [[0] * 8 for i in range(8)]
+    board[3][4] = board[4][3] = 1
+    board[3][3] = board[4][4] = 2
+    return StateHolder(board, 0)
+
+
+def book_positions(plies):
+    """ (black, white, player) of the positions reachable from the start
+    in at most plies moves, including the start, keeping one of each set
+    of symmetric positions. """
+    seen = {}
+    frontier = [start_position()]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for state in frontier:
+            key = canonical_key(state.discs[0], state.discs[1],
+                                state.current_player)
+            if key in seen:
+                continue
+            moves = state.get_move_mask()
+            if not moves:
+                continue
+            seen[key] = (state.discs[0], state.discs[1],
+                         state.current_player)
+            if ply == plies:
+                continue
+            for sq in bitboard.iter_squares(moves):
+                child = copy.deepcopy(state)
+                child.make_move(sq)
+                if not child.has_legal_move():
+                    child.pass_turn()
+                next_frontier.append(child)
+        frontier = next_frontier
+    return list(seen.values())
+
+
+def search_position(task):
+    """ Pool task: (key, score, square) of a position searched to depth. """
+    black, white, player, depth = task
+    state = StateHolder(bitboard.to_grid(black, white), player)
+    move, value, nodes = fixed_depth_search(state, depth)
+    score = int(round(max(-32767, min(32767, value))))
+    return state.hash, score, bitboard.square(*move)
+
+
+def write_book(path, entries):
+    """ Write (key, score, square) entries, sorted by key. """
+    entries = sorted(entries)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        for key, score, sq in entries:
+            f.write(RECORD.pack(key, score, sq))
+
+
+def build(path, plies, depth, processes=None):
+    positions = book_positions(plies)
+    print('%d positions to depth %d' % (len(positions), depth))
+    start = time.time()
+    tasks = [position + (depth,) for position in positions]
+    with multiprocessing.Pool(processes) as pool:
+        entries = pool.map(search_position, tasks, chunksize=4)
+    write_book(path, entries)
+    print('wrote %s in %.1f s' % (path, time.time() - start))
+
+
+def show(path):
+    book = OpeningBook(path)
+    start = start_position()
+    move = book.lookup(start)
+    print('%d entries, start position move %s' % (len(book), move))
+    book.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Othello opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build')
+    build_parser.add_argument('--plies', type=int, default=DEFAULT_PLIES)
+    build_parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    build_parser.add_argument('--processes', type=int, default=None)
+    build_parser.add_argument('--out', default=BOOK_PATH)
+    show_parser = commands.add_parser('show')
+    show_parser.add_argument('--book', default=BOOK_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args.out, args.plies, args.depth, args.processes)
+    else:
+        show(args.book)
+
+
+if __name__ == '__main__':
+    main()
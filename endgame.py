@@ -0,0 +1,298 @@
+"""Exact endgame solver.
+
+Near the end of the game the heuristic terms of board_value no longer
+matter: only the final disc count does. EndgameSolver searches to the
+end of the game and scores positions by disc difference, working on the
+two bitboards directly instead of a StateHolder. It orders moves
+
+    * fastest-first while many squares are empty: moves that leave the
+      opponent the fewest replies (and corners) first;
+    * by parity over the last few empties: moves into a quadrant with an
+      odd number of empty squares first, since the last move in a region
+      tends to be worth having;
+
+and resolves the last empty square without generating moves at all.
+When the window asks for more than the opponent's stable discs leave
+possible (they are the opponent's at the end, so the score is at most 64
+minus twice their number), a node fails low without being searched.
+
+best_move first proves a win, draw or loss with a null window around
+zero, which is much cheaper, and then spends what is left of its time on
+the exact score.
+"""
+
+import time
+
+import bitboard
+from bitboard import popcount
+from min_max_ai import SearchTimeout, CHECK_INTERVAL
+import stability
+
+# Default number of empty squares from which select_move solves exactly.
+DEFAULT_EMPTIES = 14
+# Keep positions with at least this many empties in the table.
+TABLE_EMPTIES = 6
+# From this many empties down, try every empty square in parity order
+# instead of generating and sorting moves.
+SHALLOW_EMPTIES = 5
+# Bound types of table entries.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+QUADRANTS = [0x000000000f0f0f0f, 0x00000000f0f0f0f0,
+             0x0f0f0f0f00000000, 0xf0f0f0f000000000]
+
+
+class EndgameSolver:
+    """ Negamax alpha-beta to the end of the game on (own, opp) bitboards,
+    where own is the player to move. Scores are own's final disc count
+    minus opp's.
+
+    Node and time counters add up over every solve; reset() zeroes them.
+    """
+
+    def __init__(self):
+        self.table = {}
+        self.deadline = float('inf')
+        # Nodes left before the next look at the clock.
+        self.next_check = CHECK_INTERVAL
+        self.stability = stability.stability(bitboard.geometry(bitboard.N))
+        self.reset()
+
+    def clear(self):
+        """ Forget the positions solved so far. The table is kept from one
+        solve to the next, since its bounds hold whatever the window. """
+        self.table = {}
+
+    def reset(self):
+        self.nodes = 0
+        self.solves = 0
+        self.elapsed = 0.0
+        self.timeouts = 0
+
+    def stats(self):
+        """ Counters of the solves so far. """
+        return {'solves': self.solves, 'nodes': self.nodes,
+                'time': self.elapsed, 'timeouts': self.timeouts,
+                'nps': self.nodes / self.elapsed if self.elapsed else 0.0}
+
+    def solve(self, own, opp, time_limit=float('inf'), alpha=-64, beta=64,
+              deadline=None):
+        """ (best square or -1, score) of a position. Raises SearchTimeout
+        if time_limit seconds pass first, or deadline (a time.time() value)
+        if one is given. """
+        start = time.time()
+        self.deadline = deadline if deadline is not None \
+            else start + time_limit
+        self.next_check = CHECK_INTERVAL
+        self.solves += 1
+        try:
+            return self.search_root(own, opp, alpha, beta)
+        except SearchTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            self.elapsed += time.time() - start
+
+    def best_move(self, state, deadline):
+        """ Move (row, col) with the best final result for a
+        min_max_ai.StateHolder, or None if it cannot be solved before
+        deadline, a time.time() value. """
+        own = state.discs[state.current_player]
+        opp = state.discs[1 - state.current_player]
+        self.clear()
+        try:
+            sq, score = self.solve(own, opp, alpha=-1, beta=1,
+                                   deadline=deadline)
+        except SearchTimeout:
+            return None
+        if sq < 0:
+            return None
+        try:
+            # Within the proven result, look for the largest margin. The
+            # window stays open just below (above) the bound proven, so
+            # a move worth exactly that bound is not lost to a fail low
+            # (high) among moves that are worse.
+            if score >= 1:
+                sq = self.solve(own, opp, alpha=score - 1, beta=64,
+                                deadline=deadline)[0]
+            elif score <= -1:
+                sq = self.solve(own, opp, alpha=-64, beta=score + 1,
+                                deadline=deadline)[0]
+        except SearchTimeout:
+            pass
+        return bitboard.coord(sq)
+
+    def check_clock(self):
+        """ Raise SearchTimeout if the deadline has passed; called every
+        CHECK_INTERVAL nodes of search and search_shallow. """
+        self.next_check = CHECK_INTERVAL
+        if time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def search_root(self, own, opp, alpha, beta):
+        moves = bitboard.get_moves(own, opp)
+        if not moves:
+            return -1, -self.search(opp, own, -beta, -alpha, False)
+        best = -65
+        best_sq = -1
+        for sq in self.order(own, opp, moves):
+            flips = bitboard.get_flips(own, opp, sq)
+            value = -self.search(opp ^ flips, own | flips | (1 << sq),
+                                 -beta, -alpha, False)
+            if value > best:
+                best = value
+                best_sq = sq
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        return best_sq, best
+
+    def order(self, own, opp, moves, hash_move=-1):
+        """ moves as a list of squares, best first; hash_move, the best
+        move of an earlier search of the position, goes first. """
+        squares = list(bitboard.iter_squares(moves))
+        if len(squares) < 2:
+            return squares
+        if hash_move >= 0:
+            squares.remove(hash_move)
+            return [hash_move] + self.order(own, opp,
+                                            moves ^ (1 << hash_move))
+        keyed = []
+        for sq in squares:
+            flips = bitboard.get_flips(own, opp, sq)
+            replies = bitboard.get_moves(opp ^ flips, own | flips | (1 << sq))
+            keyed.append((popcount(replies) +
+                          popcount(replies & bitboard.CORNERS), sq))
+        keyed.sort()
+        return [sq for key, sq in keyed]
+
+    def search(self, own, opp, alpha, beta, passed):
+        """ Score of the position with own to move, within (alpha, beta). """
+        self.nodes += 1
+        self.next_check -= 1
+        if self.next_check <= 0:
+            self.check_clock()
+
+        empty = ~(own | opp) & bitboard.FULL
+        empties = popcount(empty)
+        if empties <= SHALLOW_EMPTIES:
+            return self.search_shallow(own, opp, alpha, beta, passed, empty)
+
+        moves = bitboard.get_moves(own, opp)
+        if not moves:
+            if passed:
+                return popcount(own) - popcount(opp)
+            return -self.search(opp, own, -beta, -alpha, True)
+
+        key = None
+        hash_move = -1
+        if empties >= TABLE_EMPTIES:
+            key = (own, opp)
+            entry = self.table.get(key)
+            if entry is not None:
+                flag, score, hash_move = entry
+                if flag == EXACT:
+                    return score
+                elif flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        # Look for stable discs only when opp has enough discs for them
+        # to reach alpha.
+        if alpha >= 64 - 2 * popcount(opp):
+            bound = 64 - 2 * popcount(self.stability.stable(opp, own))
+            if bound <= alpha:
+                return bound
+        alpha_orig = alpha
+
+        best = -65
+        best_sq = -1
+        for sq in self.order(own, opp, moves, hash_move):
+            flips = bitboard.get_flips(own, opp, sq)
+            child_own = opp ^ flips
+            child_opp = own | flips | (1 << sq)
+            if best_sq < 0:
+                value = -self.search(child_own, child_opp, -beta, -alpha,
+                                     False)
+            else:
+                # Prove the move no better than the best so far with a null
+                # window; search it again fully only if that fails.
+                value = -self.search(child_own, child_opp, -alpha - 1,
+                                     -alpha, False)
+                if alpha < value < beta:
+                    value = -self.search(child_own, child_opp, -beta,
+                                         -value, False)
+            if value > best:
+                best = value
+                best_sq = sq
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if key is not None:
+            if best <= alpha_orig:
+                flag = UPPER
+            elif best >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+            self.table[key] = (flag, best, best_sq)
+        return best
+
+    def search_shallow(self, own, opp, alpha, beta, passed, empty):
+        """ search for the last few empty squares: no move generation or
+        table, just every empty square tried in parity order. """
+        if not empty:
+            return popcount(own) - popcount(opp)
+        if empty & (empty - 1) == 0:
+            return self.last_move(own, opp, empty.bit_length() - 1)
+        self.nodes += 1
+        self.next_check -= 1
+        if self.next_check <= 0:
+            self.check_clock()
+        odd = 0
+        for quadrant in QUADRANTS:
+            if popcount(empty & quadrant) & 1:
+                odd |= quadrant
+        best = -65
+        for squares in (empty & odd, empty & ~odd):
+            while squares:
+                bit = squares & -squares
+                squares ^= bit
+                sq = bit.bit_length() - 1
+                flips = bitboard.get_flips(own, opp, sq)
+                if not flips:
+                    continue
+                value = -self.search_shallow(opp ^ flips, own | flips | bit,
+                                             -beta, -alpha, False,
+                                             empty ^ bit)
+                if value > best:
+                    best = value
+                    if value > alpha:
+                        alpha = value
+                        if alpha >= beta:
+                            return best
+        if best == -65:
+            if passed:
+                return popcount(own) - popcount(opp)
+            return -self.search_shallow(opp, own, -beta, -alpha, True, empty)
+        return best
+
+    def last_move(self, own, opp, sq):
+        """ Final score with only sq empty: own plays it if it can,
+        otherwise opp does, otherwise it stays empty. """
+        self.nodes += 1
+        flips = bitboard.get_flips(own, opp, sq)
+        if flips:
+            count = popcount(flips)
+            return popcount(own) - popcount(opp) + 2 * count + 1
+        flips = bitboard.get_flips(opp, own, sq)
+        if flips:
+            count = popcount(flips)
+            return popcount(own) - popcount(opp) - 2 * count - 1
+        return popcount(own) - popcount(opp)
@@ -0,0 +1,202 @@
+"""Othello rules and game state with no display code.
+
+Game holds the board, the player to move and the disc counts, and
+applies moves, passes and the end-of-game test. othello.Othello wraps
+it to draw the board with turtle; simulations, tests and servers can use
+it directly without opening a window.
+"""
+
+MOVE_DIRS = [(-1, -1), (-1, 0), (-1, +1),
+             (0, -1),           (0, +1),
+             (+1, -1), (+1, 0), (+1, +1)]
+
+
+def format_move(move):
+    """ Move (row, col) in the usual notation: column letter, then row
+    number from 1, e.g. (2, 3) is 'd3'. """
+    return 'abcdefghijklmnopqrstuvwxyz'[move[1]] + str(move[0] + 1)
+
+
+def parse_move(text):
+    """ Inverse of format_move. """
+    text = text.strip().lower()
+    return (int(text[1:]) - 1, ord(text[0]) - ord('a'))
+
+
+class Game:
+
+    def __init__(self, n = 8):
+        self.n = n
+        self.board = [[0] * n for i in range(n)]
+        self.current_player = 0
+        self.num_tiles = [2, 2]
+        # Empty squares next to at least one disc: the only squares that
+        # can be legal moves.
+        self.candidates = set()
+        # Legal moves of each player in the current position, or None
+        # until asked for; make_move clears both.
+        self.legal_moves = [None, None]
+        # Squares played so far, in order, and the player who played the
+        # first of them; passes are not recorded.
+        self.moves = []
+        self.first_player = None
+
+    def initialize_board(self):
+        """ Put the four starting discs on the board and return them as
+        (square, player) pairs. """
+        if self.n < 2:
+            return []
+
+        coord1 = int(self.n / 2 - 1)
+        coord2 = int(self.n / 2)
+        initial_squares = [(coord1, coord2), (coord1, coord1),
+                           (coord2, coord1), (coord2, coord2)]
+
+        placed = []
+        for i in range(len(initial_squares)):
+            color = i % 2
+            row = initial_squares[i][0]
+            col = initial_squares[i][1]
+            self.board[row][col] = color + 1
+            placed.append((initial_squares[i], color))
+        self.candidates = set()
+        for square, color in placed:
+            self.add_candidates(square)
+        self.legal_moves = [None, None]
+        self.moves = []
+        self.first_player = None
+        return placed
+
+    def add_candidates(self, square):
+        """ Add the empty neighbours of a newly placed disc to the
+        candidates. """
+        for direction in MOVE_DIRS:
+            row = square[0] + direction[0]
+            col = square[1] + direction[1]
+            if self.is_valid_coord(row, col) and self.board[row][col] == 0:
+                self.candidates.add((row, col))
+
+    def make_move(self, move):
+        """ Play move for the current player and give the turn to the other
+        player. Returns the flipped squares, or None if move is illegal. """
+        if not self.is_legal_move(move):
+            return None
+        self.board[move[0]][move[1]] = self.current_player + 1
+        self.num_tiles[self.current_player] += 1
+        self.candidates.discard(move)
+        self.add_candidates(move)
+        self.legal_moves = [None, None]
+        if not self.moves:
+            self.first_player = self.current_player
+        self.moves.append(move)
+        flipped = self.flip_tiles(move)
+        self.current_player = 1 - self.current_player
+        return flipped
+
+    def flip_tiles(self, move):
+        """ Flip every disc bracketed by move and return their squares. """
+        curr_tile = self.current_player + 1
+        flipped = []
+        for direction in MOVE_DIRS:
+            if self.has_tile_to_flip(move, direction):
+                i = 1
+                while True:
+                    row = move[0] + direction[0] * i
+                    col = move[1] + direction[1] * i
+                    if self.board[row][col] == curr_tile:
+                        break
+                    else:
+                        self.board[row][col] = curr_tile
+                        self.num_tiles[self.current_player] += 1
+                        self.num_tiles[(self.current_player + 1) % 2] -= 1
+                        flipped.append((row, col))
+                        i += 1
+        return flipped
+
+    def pass_turn(self):
+        """ Give the turn to the other player without playing. """
+        self.current_player = 1 - self.current_player
+
+    def has_tile_to_flip(self, move, direction, player = None):
+
+        if player is None:
+            player = self.current_player
+        i = 1
+        if player in (0, 1) and \
+           self.is_valid_coord(move[0], move[1]):
+            curr_tile = player + 1
+            while True:
+                row = move[0] + direction[0] * i
+                col = move[1] + direction[1] * i
+                if not self.is_valid_coord(row, col) or \
+                    self.board[row][col] == 0:
+                    return False
+                elif self.board[row][col] == curr_tile:
+                    break
+                else:
+                    i += 1
+        return i > 1
+
+    def has_legal_move(self):
+
+        return len(self.get_legal_moves()) > 0
+
+    def get_legal_moves(self, player = None):
+        """ Legal moves of player (by default the one to move), in
+        row-major order. Only the candidate squares are probed, and the
+        result is kept until the next move. """
+        if player is None:
+            player = self.current_player
+        if player not in (0, 1):
+            return []
+        moves = self.legal_moves[player]
+        if moves is None:
+            moves = [move for move in sorted(self.candidates)
+                     if self.is_legal_move(move, player)]
+            self.legal_moves[player] = moves
+        return moves
+
+    def is_legal_move(self, move, player = None):
+
+        if move != () and self.is_valid_coord(move[0], move[1]) \
+           and self.board[move[0]][move[1]] == 0:
+            for direction in MOVE_DIRS:
+                if self.has_tile_to_flip(move, direction, player):
+                    return True
+        return False
+
+    def is_valid_coord(self, row, col):
+
+        if 0 <= row < self.n and 0 <= col < self.n:
+            return True
+        return False
+
+    def must_pass(self):
+        """ True if the current player has no move but the game goes on. """
+        return not self.has_legal_move() and not self.is_game_over()
+
+    def is_game_over(self):
+        """ True once neither player can move. """
+        if sum(self.num_tiles) == self.n ** 2:
+            return True
+        return not self.get_legal_moves(0) and not self.get_legal_moves(1)
+
+    def winner(self):
+        """ 0 or 1 for the player with more discs, None on a tie. """
+        if self.num_tiles[0] > self.num_tiles[1]:
+            return 0
+        elif self.num_tiles[0] < self.num_tiles[1]:
+            return 1
+        return None
+
+    def __str__(self):
+
+        player_str = 'Current player: ' + str(self.current_player + 1) + '\n'
+        num_tiles_str = '# of black tiles -- 1: ' + str(self.num_tiles[0]) + \
+                        '\n' + '# of white tiles -- 2: ' + \
+                        str(self.num_tiles[1]) + '\n'
+        board_str = 'State of the board:\n'
+        for row in self.board:
+            board_str += str(row) + '\n'
+
+        return player_str + num_tiles_str + board_str
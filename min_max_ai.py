@@ -1,75 +1,224 @@
-from copy import deepcopy
+import functools
 import math
-import random
 import time
 
-MAX_DEPTH = 3
+import bitboard
+from bitboard import popcount
+import transposition
+from transposition import EXACT, LOWER, UPPER
+from move_ordering import MoveOrderer
+import patterns
+import stability
+from search_stats import SearchStats
+from weights import TERM_WEIGHTS, positional_weights, corner_adjacent
+
+MAX_DEPTH = 60
 MINIMUM = -math.inf
 MAXIMUM = math.inf
-MOVE_DIRS = [(-1, -1), (-1, 0), (-1, +1),
-             (0, -1),           (0, +1),
-             (+1, -1), (+1, 0), (+1, +1)]
+WIN_SCORE = 1000000
+# Nodes searched between two looks at the clock.
+CHECK_INTERVAL = 1024
+
+class BoardTables:
+    """ What the engine precomputes for one board size: the bitboard
+    geometry, Zobrist keys, positional weights by square, the neighbours
+    of each square, each corner with the three squares next to it and the
+    line masks of the stable disc search. """
+
+    def __init__(self, n):
+        self.n = n
+        self.geometry = bitboard.geometry(n)
+        self.zobrist, self.flip_keys = transposition.board_keys(n * n)
+        self.weights = positional_weights(n)
+        self.v_squares = [w for row in self.weights for w in row]
+        self.neighbours = [self.geometry.neighbours(1 << sq)
+                           for sq in range(n * n)]
+        self.corner_neighbours = []
+        for corner, adjacent in corner_adjacent(n):
+            mask = 0
+            for square in adjacent:
+                mask |= 1 << self.geometry.square(*square)
+            self.corner_neighbours.append(
+                (1 << self.geometry.square(*corner), mask))
+        # The squares next to the empty corners, by which corners are
+        # empty.
+        self.near_empty_corners = {0: 0}
+        for corner, mask in self.corner_neighbours:
+            for empty, near in list(self.near_empty_corners.items()):
+                self.near_empty_corners[empty | corner] = near | mask
+        self.stability = stability.stability(self.geometry)
+
+_board_tables = {}
+
+def board_tables(n):
+    if n not in _board_tables:
+        _board_tables[n] = BoardTables(n)
+    return _board_tables[n]
 
 class StateHolder:
     def __init__(self, board, player):
-        self.n = 8
-        self.board = board
+        self.n = len(board)
+        self.tables = board_tables(self.n)
+        self.geometry = self.tables.geometry
+        self.discs = list(self.geometry.from_grid(board))
         self.current_player = player
-        self.move = ()
-
-    def make_move(self):
-        if self.is_legal_move(self.move):
-            self.board[self.move[0]][self.move[1]] = self.current_player + 1
-            self.flip_tiles()
-
-    def flip_tiles(self):
-        curr_tile = self.current_player + 1 
-        for direction in MOVE_DIRS:
-            if self.has_tile_to_flip(self.move, direction):
-                i = 1
-                while True:
-                    row = self.move[0] + direction[0] * i
-                    col = self.move[1] + direction[1] * i
-                    if self.board[row][col] == curr_tile:
-                        break
-                    else:
-                        self.board[row][col] = curr_tile
-                        i += 1
-
-    def has_tile_to_flip(self, move, direction):
-        i = 1
-        if self.current_player in (0, 1) and \
-           self.is_valid_coord(move[0], move[1]):
-            curr_tile = self.current_player + 1
-            while True:
-                row = move[0] + direction[0] * i
-                col = move[1] + direction[1] * i
-                if not self.is_valid_coord(row, col) or \
-                    self.board[row][col] == 0:
-                    return False
-                elif self.board[row][col] == curr_tile:
-                    break
-                else:
-                    i += 1
-        return i > 1
+        self.hash = transposition.hash_position(self.discs[0], self.discs[1],
+                                                player, self.n * self.n)
+        # Running evaluation terms, kept up to date by make_move and
+        # unmake_move: disc counts, sums of V over each player's discs and
+        # the discs next to an empty square.
+        v_squares = self.tables.v_squares
+        self.counts = [popcount(discs) for discs in self.discs]
+        self.positional = [sum(v_squares[sq]
+                               for sq in bitboard.iter_squares(discs))
+                           for discs in self.discs]
+        occupied = self.discs[0] | self.discs[1]
+        self.frontier = occupied & self.geometry.neighbours(
+            ~occupied & self.geometry.full)
+        # One record per move made, so the search can walk a single
+        # position and take moves back: (placed disc, flipped discs,
+        # previous hash, previous frontier, V gained by the mover, V of
+        # the flipped discs).
+        self.history = []
+        # Pattern indices kept by use_patterns, and their value before
+        # each move in history.
+        self.patterns = None
+        self.pattern_indices = None
+        self.pattern_history = []
+
+    def __deepcopy__(self, memo):
+        # The bitboards are immutable ints, so a shallow copy of the disc
+        # list is a full copy of the position.
+        other = StateHolder.__new__(StateHolder)
+        other.n = self.n
+        other.tables = self.tables
+        other.geometry = self.geometry
+        other.discs = self.discs[:]
+        other.current_player = self.current_player
+        other.hash = self.hash
+        other.counts = self.counts[:]
+        other.positional = self.positional[:]
+        other.frontier = self.frontier
+        other.history = self.history[:]
+        other.patterns = self.patterns
+        other.pattern_indices = self.pattern_indices
+        other.pattern_history = self.pattern_history[:]
+        return other
+
+    def use_patterns(self, patterns):
+        """ Keep the instance indices of a patterns.PatternEvaluator up to
+        date from now on. """
+        if self.patterns is patterns:
+            return
+        self.patterns = patterns
+        self.pattern_indices = patterns.indices(self.discs[0], self.discs[1])
+        # Moves made before now are taken back without the indices, which
+        # are then worked out again.
+        self.pattern_history = [None] * len(self.history)
+
+    @property
+    def board(self):
+        return self.geometry.to_grid(self.discs[0], self.discs[1])
+
+    def make_move(self, sq, flips=None):
+        """ Play the legal move on square index sq for the player to move,
+        then hand the turn to the other player. flips are the discs it
+        flips, if already known. """
+        player = self.current_player
+        own = self.discs[player]
+        opp = self.discs[1 - player]
+        bit = 1 << sq
+        tables = self.tables
+        if flips is None:
+            flips = self.geometry.get_flips(own, opp, sq)
+        self.discs[player] = own | flips | bit
+        self.discs[1 - player] = opp ^ flips
+        self.current_player = 1 - player
+
+        key = self.hash ^ transposition.SIDE_KEY ^ tables.zobrist[player][sq]
+        flip_keys = tables.flip_keys
+        v_squares = tables.v_squares
+        flip_weight = 0
+        rest = flips
+        while rest:
+            lsb = rest & -rest
+            f = lsb.bit_length() - 1
+            key ^= flip_keys[f]
+            flip_weight += v_squares[f]
+            rest ^= lsb
+        gain = v_squares[sq] + flip_weight
+        self.history.append((bit, flips, self.hash, self.frontier, gain,
+                             flip_weight))
+        self.hash = key
+
+        flip_count = popcount(flips)
+        self.counts[player] += flip_count + 1
+        self.counts[1 - player] -= flip_count
+        self.positional[player] += gain
+        self.positional[1 - player] -= flip_weight
+
+        # Filling sq can only take frontier status away from the discs
+        # around it, and gives it to the new disc if an empty square is
+        # still next to it.
+        empty = ~(own | opp | bit) & self.geometry.full
+        neighbours = tables.neighbours
+        frontier = self.frontier
+        rest = neighbours[sq] & frontier
+        while rest:
+            lsb = rest & -rest
+            if not neighbours[lsb.bit_length() - 1] & empty:
+                frontier ^= lsb
+            rest ^= lsb
+        if neighbours[sq] & empty:
+            frontier |= bit
+        self.frontier = frontier
+
+        if self.patterns is not None:
+            self.pattern_history.append(self.pattern_indices)
+            self.pattern_indices = self.patterns.update(
+                self.pattern_indices, sq, flips, player)
+
+    def pass_turn(self):
+        """ Hand the turn over without playing; undone by unmake_move. """
+        self.current_player = 1 - self.current_player
+        self.history.append((0, 0, self.hash, self.frontier, 0, 0))
+        self.hash ^= transposition.SIDE_KEY
+        if self.patterns is not None:
+            self.pattern_history.append(self.pattern_indices)
+
+    def unmake_move(self):
+        """ Take back the last make_move or pass_turn. """
+        bit, flips, self.hash, self.frontier, gain, flip_weight = \
+            self.history.pop()
+        player = 1 - self.current_player
+        self.current_player = player
+        self.discs[player] ^= flips | bit
+        self.discs[1 - player] ^= flips
+        flip_count = popcount(flips)
+        self.counts[player] -= flip_count + popcount(bit)
+        self.counts[1 - player] += flip_count
+        self.positional[player] -= gain
+        self.positional[1 - player] += flip_weight
+        if self.patterns is not None:
+            indices = self.pattern_history.pop()
+            if indices is None:
+                indices = self.patterns.indices(self.discs[0],
+                                                self.discs[1])
+            self.pattern_indices = indices
+
+    def get_move_mask(self):
+        """ Bitboard of the legal moves of the player to move. """
+        return self.geometry.get_moves(self.discs[self.current_player],
+                                       self.discs[1 - self.current_player])
 
     def has_legal_move(self):
-        for row in range(self.n):
-            for col in range(self.n):
-                move = (row, col)
-                if self.is_legal_move(move):
-                    return True
-        return False
+        return self.get_move_mask() != 0
 
     def get_legal_moves(self):
-        moves = []
-        for row in range(self.n):
-            for col in range(self.n):
-                move = (row, col)
-                if self.is_legal_move(move):
-                    moves.append(move)
-        return moves
-    
+        coord = self.geometry.coord
+        return [coord(sq)
+                for sq in bitboard.iter_squares(self.get_move_mask())]
+
     def is_valid_coord(self, row, col):
        
         if 0 <= row < self.n and 0 <= col < self.n:
@@ -78,137 +227,409 @@ class StateHolder:
     
     def is_legal_move(self, move):
        
-        if move != () and self.is_valid_coord(move[0], move[1]) \
-           and self.board[move[0]][move[1]] == 0:
-            for direction in MOVE_DIRS:
-                if self.has_tile_to_flip(move, direction):
-                    return True
+        if move != () and self.is_valid_coord(move[0], move[1]):
+            sq = self.geometry.square(move[0], move[1])
+            return bool(self.get_move_mask() >> sq & 1)
         return False
     
     def get_squares(self, player):
-        """ Get the coordinates (x,y) for all pieces on the board of the given color.
-        (1 for white, -1 for black, 0 for empty spaces) """
-        squares=[]
-        for y in range(8):
-            for x in range(8):
-                if self.board[x][y]==(player+1):
-                    squares.append((x,y))
-        return squares
-
+        """ Get the coordinates (row, col) for all pieces on the board of the
+        given player (0 for black, 1 for white). """
+        coord = self.geometry.coord
+        return [coord(sq)
+                for sq in bitboard.iter_squares(self.discs[player])]
+
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search once the deadline has passed. """
+
+
+class SearchContext:
+    """ State shared by every node of one alpha_beta_minimax call. """
+
+    def __init__(self, deadline, table, orderer, root_ply=0,
+                 batch_leaves=False, stop=None, evaluate=None, stats=None):
+        self.deadline = deadline
+        # Leaf evaluation function; board_value unless told otherwise.
+        self.evaluate = evaluate if evaluate is not None else board_value
+        # Called on the root position before searching it, for evaluators
+        # that keep state of their own up to date (patterns).
+        self.prepare = getattr(self.evaluate, 'prepare', None)
+        # Optional search_stats.SearchStats to fill in. It times leaf
+        # evaluation and move generation through wrappers, so without it
+        # the search pays for nothing but a few `is None` tests.
+        self.stats = stats
+        self.get_moves = None
+        if stats is not None:
+            self.evaluate = stats.timed_evaluate(self.evaluate)
+        # Value of a move for the player making it, for the nodes one ply
+        # above the leaves.
+        if self.evaluate is board_value:
+            self.move_value = move_value
+        else:
+            self.move_value = functools.partial(value_after_move,
+                                                self.evaluate)
+        # Optional event (threading or multiprocessing) that ends the
+        # search early once set.
+        self.stop = stop
+        self.table = table
+        self.orderer = orderer
+        # Score all the leaf children of a node in one batch_eval call.
+        self.batch_leaves = batch_leaves
+        # Length of the position's history at the root, so a node's ply
+        # is len(board.history) - root_ply.
+        self.root_ply = root_ply
+        self.nodes = 0
+        # Nodes left before the next look at the clock and the stop event.
+        self.next_check = CHECK_INTERVAL
+        # Best root move of the iteration in progress.
+        self.best_move = None
+
+
+def alpha_beta_minimax(board, time_constrain, max_depth=MAX_DEPTH,
+                       table=None, orderer=None, batch_leaves=False,
+                       stop=None, evaluate=None, collect_stats=False):
+    """ Iterative deepening: search the root to depth 1, 2, 3, ... until
+    time_constrain seconds have passed, and return the best move of the
+    deepest iteration that finished.
+
+    Pass a transposition.TranspositionTable as table and a
+    move_ordering.MoveOrderer as orderer to keep search results and move
+    statistics from one move to the next; otherwise fresh ones are used.
+    With batch_leaves, the children of nodes one ply above the leaves are
+    scored together by batch_eval, which needs NumPy and an 8 x 8 board.
+    Setting the stop event ends the search early, as if time had run out.
+    evaluate replaces board_value at the leaves. With collect_stats, the
+    result is (move, search_stats.SearchStats) instead of just the move.
+    """
+    if batch_leaves:
+        # Imported here so that NumPy is only loaded by searches using it.
+        import batch_eval
+        if not batch_eval.available():
+            raise ImportError('batch_leaves needs NumPy')
+    if batch_leaves and evaluate not in (None, board_value):
+        raise ValueError('batch_leaves only scores with board_value')
+    if batch_leaves and board.n != bitboard.N:
+        raise ValueError('batch_leaves only scores 8 x 8 boards')
+    stats = SearchStats() if collect_stats else None
+    moves = board.get_legal_moves()
+    if len(moves) == 1:
+        if stats is not None:
+            stats.finish(0, moves[0])
+            return moves[0], stats
+        return moves[0]
 
+    end_time = time.time() + time_constrain
+    if table is None:
+        table = transposition.TranspositionTable()
+    table.new_search()
+    if orderer is None:
+        orderer = MoveOrderer(board.tables.weights)
+    orderer.new_search()
+    root_ply = len(board.history)
+    context = SearchContext(end_time, table, orderer, root_ply,
+                            batch_leaves, stop, evaluate, stats)
+    report = None
+    if stats is not None:
+        context.get_moves = stats.timed_get_moves(board.geometry.get_moves)
+
+        def report(depth, move, value):
+            stats.record_iteration(depth, context.nodes)
+
+    moves = root_moves(board, context)
+    # Without a finished iteration, fall back on the move the ordering
+    # (hash move, history, square values) likes best.
+    first_move = moves[0]
+    best_move = iterative_deepening(board, moves, context, max_depth,
+                                    report=report)
+    if best_move is None:
+        best_move = first_move
+    if stats is not None:
+        stats.finish(context.nodes, best_move)
+        return best_move, stats
+    return best_move
 
-def alpha_beta_minimax(board, time_constrain):
-    best_value = -10000
-    moves = board.get_legal_moves()
+def fixed_depth_search(board, depth, stats=None):
+    """ (best move, value, nodes searched) of board searched to depth
+    plies with no time limit and a fresh table and orderer, as the opening
+    book and tune.py label positions and benchmark.py times the search.
+    The move is None if board has no legal move. stats, a
+    search_stats.SearchStats, is filled in if given. """
+    context = SearchContext(float('inf'), transposition.TranspositionTable(),
+                            MoveOrderer(board.tables.weights),
+                            len(board.history), stats=stats)
+    if stats is not None:
+        context.get_moves = stats.timed_get_moves(board.geometry.get_moves)
+    result = [0.0]
+
+    def report(d, move, value):
+        result[0] = value
+        if stats is not None:
+            stats.record_iteration(d, context.nodes)
+
+    move = iterative_deepening(board, board.get_legal_moves(), context,
+                               depth, report=report)
+    if stats is not None:
+        stats.finish(context.nodes, move)
+    return move, result[0], context.nodes
+
+def root_moves(board, context):
+    """ Legal moves of the root as (row, col), hash move first. """
+    entry = context.table.probe(board.hash)
+    hash_move = entry[3] if entry is not None else -1
+    return [board.geometry.coord(sq) for sq in
+            context.orderer.order(board.get_move_mask(), hash_move, 0,
+                                  board.current_player)]
+
+def iterative_deepening(board, moves, context, max_depth=MAX_DEPTH,
+                        first_depth=1, report=None):
+    """ Search moves at first_depth, first_depth + 1, ... until the deadline
+    and return the best move of the deepest iteration that finished, or
+    None. report(depth, move, value) is called after each iteration. """
     best_move = None
+    root_ply = len(board.history)
+    empties = board.n * board.n - popcount(board.discs[0] | board.discs[1])
+    if context.prepare is not None:
+        context.prepare(board)
+
+    depth = first_depth
+    while time.time() < context.deadline and \
+          depth <= min(max_depth, empties):
+        try:
+            value = search_root(board, moves, depth, context)
+        except SearchTimeout:
+            while len(board.history) > root_ply:
+                board.unmake_move()
+            # The unfinished iteration started with the previous best move,
+            # so whatever it has settled on so far is at least as good.
+            if context.best_move is not None:
+                best_move = context.best_move
+            break
+        best_move = context.best_move
+        if report is not None:
+            report(depth, best_move, value)
+        # The next iteration looks at the best move first.
+        moves.remove(best_move)
+        moves.insert(0, best_move)
+        depth += 1
+    return best_move
 
+def search_root(board, moves, depth, context):
+    """ Search every root move to depth plies in total, keeping the best
+    one so far in context.best_move. """
+    best_value = MINIMUM
+    context.best_move = None
     alpha = MINIMUM
     beta = MAXIMUM
 
-    end_time = time.time() + time_constrain
-
-    while time.time() < end_time:
-        for move in moves:
-            tempBoard = deepcopy(board)
-            tempBoard.move = move
-            tempBoard.make_move()
-            score = alpha_beta_search(tempBoard, 0, alpha, beta, False)
-
-            if score > best_value:
-                best_value = score
-                best_move = move
-            alpha = max(alpha, best_value)
-
-            if beta <= alpha:
-                break
-        break
-        
-    if best_move == None:
-        best_move = random.choice(moves)
-    return best_move
-
-def alpha_beta_search(board, depth, alpha, beta, player):
-    
-    if depth == MAX_DEPTH:
-        return board_value(board)
-        return calculate_heuristics(board, player)
-    
-    moves = board.get_legal_moves()
-    if player:
-        best = MINIMUM        
-        for m in moves:
-            trvBoard = deepcopy(board)
-            trvBoard.move = m
-            trvBoard.make_move()
-            value = alpha_beta_search(trvBoard, depth + 1, alpha, beta, False)
-            best = max(best, value)
-            alpha = max(alpha, value)
-            if beta <= alpha:
-                break
-        return best
+    for move in moves:
+        board.make_move(board.geometry.square(move[0], move[1]))
+        score = -alpha_beta_search(board, depth - 1, -beta, -alpha, context)
+        board.unmake_move()
+
+        if score > best_value:
+            best_value = score
+            context.best_move = move
+        alpha = max(alpha, best_value)
+
+    context.table.store(board.hash, depth, EXACT, best_value,
+                        board.geometry.square(*context.best_move))
+    return best_value
+
+def alpha_beta_search(board, depth, alpha, beta, context):
+    """ Negamax alpha-beta: the score is from the point of view of
+    board.current_player. """
+    context.nodes += 1
+    context.next_check -= 1
+    if context.next_check <= 0:
+        context.next_check = CHECK_INTERVAL
+        if time.time() > context.deadline or \
+           (context.stop is not None and context.stop.is_set()):
+            raise SearchTimeout()
+
+    if depth == 0:
+        return context.evaluate(board)
+
+    table = context.table
+    entry = table.probe(board.hash)
+    hash_move = -1
+    if entry is not None:
+        hash_move = entry[3]
+        if entry[0] >= depth:
+            flag = entry[1]
+            score = entry[2]
+            if flag == EXACT:
+                return score
+            elif flag == LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+            if alpha >= beta:
+                return score
+    alpha_orig = alpha
+
+    player = board.current_player
+    own = board.discs[player]
+    opp = board.discs[1 - player]
+    get_moves = context.get_moves or board.geometry.get_moves
+    if depth == 1 and context.batch_leaves:
+        moves = get_moves(own, opp)
+        if moves:
+            return search_leaf_batch(board, moves, context)
+
+    ply = len(board.history) - context.root_ply
+    orderer = context.orderer
+    stats = context.stats
+    best = MINIMUM
+    best_move = -1
+    ordered = orderer.staged(own, opp, hash_move, ply, player, get_moves,
+                             board.geometry.get_flips)
+    # One ply above the leaves, score the children here rather than in a
+    # call of alpha_beta_search each.
+    leaf_value = context.move_value if depth == 1 else None
+    for i, (sq, flips) in enumerate(ordered):
+        if leaf_value is not None:
+            context.nodes += 1
+            context.next_check -= 1
+            value = leaf_value(board, sq, alpha, flips)
+        else:
+            board.make_move(sq, flips)
+            value = -alpha_beta_search(board, depth - 1, -beta, -alpha,
+                                       context)
+            board.unmake_move()
+        if value > best:
+            best = value
+            best_move = sq
+        alpha = max(alpha, value)
+        if beta <= alpha:
+            orderer.record_cutoff(sq, ply, player, depth)
+            if stats is not None:
+                stats.record_cutoff(i == 0)
+            break
+
+    if best_move < 0:
+        # No legal move: pass, or the game is over.
+        if not get_moves(opp, own):
+            return final_value(board)
+        board.pass_turn()
+        value = -alpha_beta_search(board, depth, -beta, -alpha, context)
+        board.unmake_move()
+        return value
+    if stats is not None:
+        stats.expanded += 1
+
+    if best <= alpha_orig:
+        flag = UPPER
+    elif best >= beta:
+        flag = LOWER
     else:
-        best = MAXIMUM
-        for m in moves:
-            trvBoard = deepcopy(board)
-            trvBoard.move = m
-            trvBoard.make_move()
-            value = alpha_beta_search(trvBoard, depth + 1, alpha, beta, True)
-            best = min(best, value)
-            beta = min(beta, value)
-            if beta <= alpha:
-                break
-        return best
-
-def board_value(state):
-    player = state.current_player + 1
-    enemy = 2 - player
-
-    player_num = 0
-    enemy_num = 0
-    player_front = 0
-    enemy_front = 0
+        flag = EXACT
+    table.store(board.hash, depth, flag, best, best_move)
+    return best
+
+def search_leaf_batch(board, moves, context):
+    """ Depth-1 node searched by scoring every child with one batched
+    evaluation; the result is exact whatever the window. """
+    import batch_eval
+    squares = list(bitboard.iter_squares(moves))
+    player = board.current_player
+    values = batch_eval.child_values(board.discs[player],
+                                     board.discs[1 - player], player, squares)
+    context.nodes += len(squares)
+    context.next_check -= len(squares)
+    if context.stats is not None:
+        context.stats.leaves += len(squares)
+    best_index = int(values.argmax())
+    best = float(values[best_index])
+    context.table.store(board.hash, 1, EXACT, best, squares[best_index])
+    return best
+
+def final_value(state):
+    """ Score of a finished game from the point of view of the player to
+    move: a win or loss outweighs any heuristic value. """
+    diff = popcount(state.discs[state.current_player]) - \
+           popcount(state.discs[1 - state.current_player])
+    if diff > 0:
+        return WIN_SCORE + diff
+    elif diff < 0:
+        return -WIN_SCORE + diff
+    return 0
+
+def board_value(state, weights=TERM_WEIGHTS):
+    """ Heuristic value of state for the player to move: a weighted sum
+    of seven terms, with the multipliers in weights. """
+    player = state.current_player
+    return position_value(state.tables, state.discs[player],
+                          state.discs[1 - player], state.counts[player],
+                          state.counts[1 - player],
+                          state.positional[player] -
+                          state.positional[1 - player],
+                          state.frontier, weights)
+
+def move_value(board, sq, alpha=MINIMUM, flips=None):
+    """ Value of the move on sq for the player to move: minus board_value
+    of the position after it, worked out without making the move. If the
+    move cannot score more than alpha, any value up to alpha may be
+    returned, as alpha-beta needs no more. flips are the discs the move
+    flips, if already known. """
+    player = board.current_player
+    own = board.discs[player]
+    opp = board.discs[1 - player]
+    tables = board.tables
+    geometry = tables.geometry
+    if flips is None:
+        flips = geometry.get_flips(own, opp, sq)
+    v_squares = tables.v_squares
+    flip_weight = 0
+    rest = flips
+    while rest:
+        lsb = rest & -rest
+        flip_weight += v_squares[lsb.bit_length() - 1]
+        rest ^= lsb
+    flip_count = popcount(flips)
+    own |= flips | 1 << sq
+    opp ^= flips
+    # The opponent is to move next, and every disc next to an empty square
+    # is on the frontier.
+    return -position_value(tables, opp, own,
+                           board.counts[1 - player] - flip_count,
+                           board.counts[player] + flip_count + 1,
+                           board.positional[1 - player] -
+                           board.positional[player] - v_squares[sq] -
+                           2 * flip_weight,
+                           geometry.neighbours(~(own | opp) & geometry.full),
+                           TERM_WEIGHTS, -alpha)
+
+def value_after_move(evaluate, board, sq, alpha=MINIMUM, flips=None):
+    """ move_value with any leaf evaluator: minus evaluate of board after
+    the move on sq, made and taken back, whatever alpha is. """
+    board.make_move(sq, flips)
+    value = -evaluate(board)
+    board.unmake_move()
+    return value
+
+def position_value(tables, own, opp, player_num, enemy_num, d, frontier,
+                   weights=TERM_WEIGHTS, floor=MAXIMUM):
+    """ board_value of the position with discs own for the player to move
+    and opp for the other, given their disc counts, the difference of
+    their sums of V and a bitboard of the discs next to an empty
+    square. If the value is sure to be at least floor before the dearest
+    terms are worked out, some lower bound no less than floor is returned
+    instead. """
+    geometry = tables.geometry
+    empty = ~(own | opp) & geometry.full
 
     p = 0
     c = 0
     l = 0
     m = 0
     f = 0
-    d = 0
-
-    X1 = [-1, -1, 0, 1, 1, 1, 0, -1]
-    Y1 = [0, 1, 1, 1, 0, -1, -1, -1]
-
-    V = [
-            [20, -3, 11, 8, 8, 11, -3, 20],
-            [-3, -7, -4, 1, 1, -4, -7, -3],
-            [11, -4, 2, 2, 2, 2, -4, 11],
-            [8, 1, 2, -3, -3, 2, 1, 8],
-            [8, 1, 2, -3, -3, 2, 1, 8],
-            [11, -4, 2, 2, 2, 2, -4, 11],
-            [-3, -7, -4, 1, 1, -4, -7, -3],
-            [20, -3, 11, 8, 8, 11, -3, 20]
-        ]
-    
+    s = 0
+
     # Step 1
-    for i in range(state.n):
-        for j in range(state.n):
-            if state.board[i][j] == player:
-                d += V[i][j]
-                player_num += 1
-            elif state.board[i][j] == enemy:
-                d -= V[i][j]
-                enemy_num += 1
-
-            if state.board[i][j] != 0:
-                for k in range(8):
-                    x = i + X1[k]
-                    y = j + Y1[k]
-                    if x >= 0 and x < 8 and y >= 0 and y < 8 and state.board[x][y] == 0:
-                        if state.board[i][j] == player:
-                            player_front += 1
-                        else:
-                            enemy_front += 1
-                        break
+    player_front = popcount(own & frontier)
+    enemy_front = popcount(opp & frontier)
     
     # Step 2
     if player_num > enemy_num:
@@ -227,96 +648,44 @@ def board_value(state):
         f = 0
 
     # Step 4
-    player_num = enemy_num = 0
-    if state.board[0][0] == player:
-        player_num += 1
-    elif state.board[0][0] == enemy:
-        enemy_num += 1
-    if state.board[0][7] == player:
-        player_num += 1
-    elif state.board[0][7] == enemy:
-        enemy_num += 1
-    if state.board[7][0] == player:
-        player_num += 1
-    elif state.board[7][0] == enemy:
-        enemy_num += 1
-    if state.board[7][7] == player:
-        player_num += 1
-    elif state.board[7][7] == enemy:
-        enemy_num += 1
+    player_num = popcount(own & geometry.corners)
+    enemy_num = popcount(opp & geometry.corners)
     c = 25 * (player_num - enemy_num)
 
     # Step 5
-    player_num = enemy_num = 0
-    if state.board[0][0] == 0:
-        if state.board[0][1] == player:
-            player_num += 1
-        elif state.board[0][1] == enemy:
-            enemy_num += 1
-        if state.board[1][1] == player:
-            player_num += 1
-        elif state.board[1][1] == enemy:
-            enemy_num += 1
-        if state.board[1][0] == player:
-            player_num += 1
-        elif state.board[1][0] == enemy:
-            enemy_num += 1
-
-    if state.board[0][7] == 0:
-        if state.board[0][6] == player:
-            player_num += 1
-        elif state.board[0][6] == enemy:
-            enemy_num += 1
-        if state.board[1][6] == player:
-            player_num += 1
-        elif state.board[1][6] == enemy:
-            enemy_num += 1
-        if state.board[1][7] == player:
-            player_num += 1
-        elif state.board[1][7] == enemy:
-            enemy_num += 1
-
-    if state.board[7][0] == 0:
-        if state.board[7][1] == player:
-            player_num += 1
-        elif state.board[7][1] == enemy:
-            enemy_num += 1
-        if state.board[6][1] == player:
-            player_num += 1
-        elif state.board[6][1] == enemy:
-            enemy_num += 1
-        if state.board[6][0] == player:
-            player_num += 1
-        elif state.board[6][0] == enemy:
-            enemy_num += 1
-
-    if state.board[7][7] == 0:
-        if state.board[6][7] == player:
-            player_num += 1
-        elif state.board[6][7] == enemy:
-            enemy_num += 1
-        if state.board[6][6] == player:
-            player_num += 1
-        elif state.board[6][6] == enemy:
-            enemy_num += 1
-        if state.board[7][6] == player:
-            player_num += 1
-        elif state.board[7][6] == enemy:
-            enemy_num += 1
+    near_empty_corners = tables.near_empty_corners[empty & geometry.corners]
+    player_num = popcount(own & near_empty_corners)
+    enemy_num = popcount(opp & near_empty_corners)
 
     l = -12.5 * (player_num - enemy_num)
 
-    # Step 6
-    player_num = enemy_num = 0
-    if state.make_move() == []:
-        player_moves = state.make_move()
-        player_num = len(player_moves)
-
-    temp = deepcopy(state)
-    temp.current_player = enemy - 1
-    if temp.make_move() == []:
-        enemy_moves = temp.make_move()
-        enemy_num = len(enemy_moves)
+    # Mobility and stability are within +-100, and stability is 0 when no
+    # corner is taken. If the value reaches floor whatever they are, a
+    # lower bound will do (made 1 lower for rounding).
+    w = weights
+    if floor < MAXIMUM:
+        least = (w['piece'] * p) + (w['corner'] * c) + \
+                (w['corner_adjacent'] * l) + (w['frontier'] * f) + \
+                (w['positional'] * d) - 100 * abs(w['mobility']) - 1
+        if (own | opp) & geometry.corners and \
+           least - 100 * abs(w['stability']) >= floor:
+            return least - 100 * abs(w['stability'])
+
+    # Step 6 (the dearest step, so skipped when its weight is 0)
+    if w['stability']:
+        own_stable, opp_stable = tables.stability.stable_discs(own, opp)
+        player_num = popcount(own_stable)
+        enemy_num = popcount(opp_stable)
+        if player_num > enemy_num:
+            s = (100.0 * player_num) / (player_num + enemy_num)
+        elif player_num < enemy_num:
+            s = -(100.0 * enemy_num) / (player_num + enemy_num)
+
+    if floor < MAXIMUM and least + w['stability'] * s >= floor:
+        return least + w['stability'] * s
+
+    # Step 7
+    player_num, enemy_num = geometry.move_counts(own, opp)
     if player_num > enemy_num:
         m = (100.0 * player_num)/(player_num + enemy_num)
     elif player_num < enemy_num:
@@ -324,116 +693,13 @@ def board_value(state):
     else:
         m = 0
 
-    return (10 * p) + (801.724 * c) + (382.026 * l) + \
-               (78.922 * m) + (74.396 * f) + (10 * d)
-
-def calculate_heuristics(board, player):
-
-    #print "IN calculate_heuristics"
-    #calculating the heuristics based on the following 4 components:
-    #1) mobility
-    #2) stability
-    #3) corners
-    #4) coin parity
-    
-    #for mobility
-    max_player_moves = board.get_legal_moves()
-    
-    #print_moves(max_player_moves)
-    # print "init-board: \n"
-    # self.display(board)
-    max_player_mobility = len(max_player_moves)
-    #print "len: max_mob: "+str(max_player_mobility)
-    
-    min_player_mobility = float('inf')
-    num_min_player_moves = 0
-
-    for move in max_player_moves:
-
-        newboard_mob = deepcopy(board)
-        newboard_mob.move = move
-        newboard_mob.make_move()
-        newboard_mob.current_player = 1 - player
-        
-        min_player_moves = newboard_mob.get_legal_moves()
-        # print "Min-player-moves"
-        # print_moves(min_player_moves)
-
-        num_min_player_moves = len(min_player_moves)
-
-        if(num_min_player_moves < min_player_mobility):
-            min_player_mobility = num_min_player_moves
-
-    # print "Min-Player_mob: "+str(min_player_mobility)
-    # print "MAX-Player_mob: "+str(max_player_mobility)
-
-    if(max_player_mobility + min_player_mobility != 0):
-        actual_mobility = 10000*( max_player_mobility - min_player_mobility )/( max_player_mobility + min_player_mobility )
-    else:
-        actual_mobility = 0
-
-
-    #corners captured
-
-    newboard_corner = deepcopy(board)
-    all_corners = [(0,0),(7,7), (0,7), (7,0)]
-    potential_corners = [(0,2),(2,0),(5,0),(0,5),(5,7),(7,5),(2,7),(7,2)]
-    tobe_potential_corners = [(5,5),(5,2),(2,5),(2,2)]
-    unlikely_corners = [(6,1),(6,6),(1,1),(1,6),(1,7),(7,1),(0,6),(6,0),(6,7),(7,6),(1,0),(0,1)]
-    max_corner_count = 0
-    min_corner_count = 0
-    max_potential_corners = 0
-    min_potential_corners = 0
-    max_tobe_potential_corners = 0
-    min_tobe_potential_corners = 0
-
-    min_unlikely_corners = 0
-    max_unlikely_corners = 0
-
-    cood_max_squares = newboard_corner.get_squares(player)
-    cood_min_squares = newboard_corner.get_squares(1-player)
-
-    # print "min: "
-    # print cood_min_squares
-    # print "max: "
-    # print cood_max_squares
-
-    for cord_max in cood_max_squares:
-        if cord_max in all_corners:   
-            max_corner_count +=3
-        if cord_max in potential_corners:
-            max_potential_corners += 2
-        if cord_max in tobe_potential_corners:
-            max_tobe_potential_corners +=1
-
-    for cord_min in cood_min_squares:
-        if cord_min in all_corners:
-            min_corner_count +=3
-        if cord_min in potential_corners:
-            min_potential_corners += 2
-        if cord_min in tobe_potential_corners:
-            min_tobe_potential_corners +=1
-
-    total_max_corners = max_corner_count + max_potential_corners + max_tobe_potential_corners
-    total_min_corners = min_corner_count + min_potential_corners + min_tobe_potential_corners
-
-    # if (max_corner_count > 0):
-    #     print "max: "+str(max_corner_count )
-
-    # if(min_corner_count > 0):
-    #     print "min: "+str(min_corner_count)
-
-    # print "max-corners"+str(max_corner_count)
-    # print "min-corners"+str(min_corner_count)
-    
-    if(total_max_corners + total_min_corners != 0):
-        corner_heuristic = 10000*(( total_max_corners - total_max_corners )/( total_min_corners + total_max_corners ))
-    else:
-        corner_heuristic = 0
-
-    #print "actual_mobility: "+str(actual_mobility)
+    return (w['piece'] * p) + (w['corner'] * c) + \
+           (w['corner_adjacent'] * l) + (w['mobility'] * m) + \
+           (w['frontier'] * f) + (w['positional'] * d) + \
+           (w['stability'] * s)
 
-    if(corner_heuristic != 0):
-        return (actual_mobility + corner_heuristic)/2
-    else: 
-        return actual_mobility
+# Leaf evaluators that can be chosen by name, e.g. by the arena.
+EVALUATORS = {
+    'board_value': board_value,
+    'patterns': patterns.pattern_value,
+}
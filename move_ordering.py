@@ -0,0 +1,89 @@
+"""Move ordering for alpha_beta_search.
+
+Moves are tried in this order: the best move stored in the
+transposition table, the two killer moves of the ply, then by history
+score. Moves with no history fall back to a static prior taken from the
+positional weights, so corners come first and X-squares last.
+"""
+
+MAX_PLY = 128
+HASH_SCORE = 1 << 60
+KILLER_SCORE = 1 << 50
+# History scores are scaled past the largest prior so the prior only
+# breaks ties.
+HISTORY_SCALE = 64
+
+
+class MoveOrderer:
+    """ Killer and history tables, kept from one search to the next.
+
+    weights is the positional weight table the static prior is built from.
+    """
+
+    def __init__(self, weights):
+        lowest = min(w for row in weights for w in row)
+        self.prior = [w - lowest for row in weights for w in row]
+        self.squares = len(self.prior)
+        # order() sorts scores with the square in the low bits.
+        self.square_bits = (self.squares - 1).bit_length()
+        self.killers = [[-1, -1] for ply in range(MAX_PLY)]
+        self.history = [[0] * self.squares for player in range(2)]
+
+    def new_search(self):
+        """ Forget the killers and age the history of the last search. """
+        for killers in self.killers:
+            killers[0] = killers[1] = -1
+        for table in self.history:
+            for sq in range(self.squares):
+                table[sq] >>= 1
+
+    def order(self, moves, hash_move, ply, player):
+        """ Squares of the move bitboard moves, best first. """
+        killer1, killer2 = self.killers[ply]
+        history = self.history[player]
+        prior = self.prior
+        bits = self.square_bits
+        keys = []
+        while moves:
+            lsb = moves & -moves
+            moves ^= lsb
+            sq = lsb.bit_length() - 1
+            if sq == hash_move:
+                score = HASH_SCORE
+            elif sq == killer1:
+                score = KILLER_SCORE + 1
+            elif sq == killer2:
+                score = KILLER_SCORE
+            else:
+                score = history[sq] * HISTORY_SCALE + prior[sq]
+            keys.append(score << bits | sq)
+        keys.sort(reverse=True)
+        mask = (1 << bits) - 1
+        return [key & mask for key in keys]
+
+    def staged(self, own, opp, hash_move, ply, player, get_moves, get_flips):
+        """ The moves of own against opp, best first, yielded one by one as
+        (square, flipped discs or None). The hash move and killers that
+        are legal come first, with the discs get_flips found they flip; the
+        other moves are only generated, and sorted as order() sorts them,
+        once the search goes on past those. """
+        empty = ~(own | opp)
+        tried = 0
+        killer1, killer2 = self.killers[ply]
+        for sq in (hash_move, killer1, killer2):
+            if sq >= 0 and (empty & ~tried) >> sq & 1:
+                flips = get_flips(own, opp, sq)
+                if flips:
+                    tried |= 1 << sq
+                    yield sq, flips
+        for sq in self.order(get_moves(own, opp) & ~tried, hash_move, ply,
+                             player):
+            yield sq, None
+
+    def record_cutoff(self, sq, ply, player, depth):
+        """ Reward a move that caused a beta cutoff. """
+        killers = self.killers[ply]
+        if killers[0] != sq:
+            killers[1] = killers[0]
+            killers[0] = sq
+        self.history[player][sq] += depth * depth
@@ -1,124 +1,150 @@
 import score, turtle, random
 from board import Board
 from min_max_ai import *
+from transposition import TranspositionTable
+from move_ordering import MoveOrderer
+from parallel import ParallelSearch
+from game import Game
+from weights import positional_weights
+import book
+from endgame import EndgameSolver, DEFAULT_EMPTIES
+from ponder import Ponderer
+import records
 import time
 
-MOVE_DIRS = [(-1, -1), (-1, 0), (-1, +1),
-             (0, -1),           (0, +1),
-             (+1, -1), (+1, 0), (+1, +1)]
+# Shortest search left to the midgame search when the endgame solver has
+# used up its share of a move's time without a result.
+MIN_SEARCH_TIME = 0.1
 
 class Othello(Board):
-   
+    """ Turtle front end for a game.Game: it owns the rules and state,
+    this class draws them and runs the turns. """
 
     def __init__(self, n = 8):
         turtle.title("OTHELLO")
         Board.__init__(self, n)
-        self.current_player = 0
-        self.num_tiles = [2, 2]
+        self.game = Game(n)
+        self.board = self.game.board
         self.ai = True
         self.player_go_first = False
         self.time_limit = 3
+        self.table_size_mb = 16
+        self.table = TranspositionTable(self.table_size_mb)
+        self.orderer = MoveOrderer(positional_weights(n))
+        # Processes searching each AI move; more than one uses Lazy SMP.
+        self.workers = 1
+        self.parallel = None
+        # Opening book consulted before searching; None if book.bin has
+        # not been built. The book and the endgame solver are 8 x 8 only.
+        self.book = book.open_book() if n == 8 else None
+        # Solve exactly from this many empty squares down.
+        self.endgame_empties = DEFAULT_EMPTIES
+        self.endgame = EndgameSolver()
+        # Keep searching in the background while the opponent moves
+        # (single-process search only).
+        self.ponder = True
+        self.ponderer = Ponderer(self.table, self.orderer)
+        # File to append the statistics of every search to, as JSON lines;
+        # None to collect nothing.
+        self.stats_path = None
+        # File every finished game is appended to; None to keep no record.
+        self.record_file = records.RECORD_FILE
         self.time_start = 0
         self.time_end = 0
 
-    def initialize_board(self):
-        
-        if self.n < 2:
-            return
+    @property
+    def current_player(self):
+        return self.game.current_player
 
-        coord1 = int(self.n / 2 - 1)
-        coord2 = int(self.n / 2)
-        initial_squares = [(coord1, coord2), (coord1, coord1),
-                           (coord2, coord1), (coord2, coord2)]
+    @current_player.setter
+    def current_player(self, player):
+        self.game.current_player = player
+
+    @property
+    def num_tiles(self):
+        return self.game.num_tiles
+
+    def initialize_board(self):
         
-        for i in range(len(initial_squares)):
-            color = i % 2
-            row = initial_squares[i][0]
-            col = initial_squares[i][1]
-            self.board[row][col] = color + 1
-            self.draw_tile(initial_squares[i], color)
+        for square, color in self.game.initialize_board():
+            self.draw_tile(square, color)
+        self.update()
     
     def make_move(self):
        
-        if self.is_legal_move(self.move):
-            self.board[self.move[0]][self.move[1]] = self.current_player + 1
-            self.num_tiles[self.current_player] += 1
-            self.draw_tile(self.move, self.current_player)
-            self.flip_tiles()
-    
-    def flip_tiles(self):
-        
-        curr_tile = self.current_player + 1 
-        for direction in MOVE_DIRS:
-            if self.has_tile_to_flip(self.move, direction):
-                i = 1
-                while True:
-                    row = self.move[0] + direction[0] * i
-                    col = self.move[1] + direction[1] * i
-                    if self.board[row][col] == curr_tile:
-                        break
-                    else:
-                        self.board[row][col] = curr_tile
-                        self.num_tiles[self.current_player] += 1
-                        self.num_tiles[(self.current_player + 1) % 2] -= 1
-                        self.draw_tile((row, col), self.current_player)
-                        i += 1
-
-    def has_tile_to_flip(self, move, direction):
-       
-        i = 1
-        if self.current_player in (0, 1) and \
-           self.is_valid_coord(move[0], move[1]):
-            curr_tile = self.current_player + 1
-            while True:
-                row = move[0] + direction[0] * i
-                col = move[1] + direction[1] * i
-                if not self.is_valid_coord(row, col) or \
-                    self.board[row][col] == 0:
-                    return False
-                elif self.board[row][col] == curr_tile:
-                    break
-                else:
-                    i += 1
-        return i > 1
+        player = self.current_player
+        flipped = self.game.make_move(self.move)
+        if flipped is not None:
+            self.draw_tile(self.move, player)
+            for square in flipped:
+                self.draw_tile(square, player)
+            self.update()
+            self.current_player = player
 
     def has_legal_move(self):
         
-        for row in range(self.n):
-            for col in range(self.n):
-                move = (row, col)
-                if self.is_legal_move(move):
-                    return True
-        return False
+        return self.game.has_legal_move()
     
     def get_legal_moves(self):
         
-        moves = []
-        for row in range(self.n):
-            for col in range(self.n):
-                move = (row, col)
-                if self.is_legal_move(move):
-                    moves.append(move)
-        return moves
+        return self.game.get_legal_moves()
 
     def is_legal_move(self, move):
        
-        if move != () and self.is_valid_coord(move[0], move[1]) \
-           and self.board[move[0]][move[1]] == 0:
-            for direction in MOVE_DIRS:
-                if self.has_tile_to_flip(move, direction):
-                    return True
-        return False
+        return self.game.is_legal_move(move)
 
     def is_valid_coord(self, row, col):
        
-        if 0 <= row < self.n and 0 <= col < self.n:
-            return True
-        return False
+        return self.game.is_valid_coord(row, col)
     
     def select_move(self, cur_state, player_to_move, remain_time):
         temp = StateHolder(cur_state, player_to_move)
-        return alpha_beta_minimax(temp, remain_time)
+        if self.book is not None:
+            move = self.book.lookup(temp)
+            if move is not None:
+                self.ponderer.stop()
+                return move
+        empties = self.n ** 2 - sum(self.num_tiles)
+        if not (self.n == 8 and empties <= self.endgame_empties):
+            # If the ponder search guessed the last move, it simply goes
+            # on for remain_time.
+            move = self.ponderer.finish(temp, remain_time)
+            if move is not None:
+                if self.stats_path is not None and \
+                   self.ponderer.stats is not None:
+                    self.ponderer.stats.info['ponder'] = True
+                    self.write_stats(self.ponderer.stats, empties,
+                                     remain_time)
+                return move
+        else:
+            self.ponderer.stop()
+            # Half the time for the solver, the rest for a normal search
+            # if it does not finish, but never less than MIN_SEARCH_TIME.
+            deadline = time.time() + remain_time
+            move = self.endgame.best_move(temp, deadline - remain_time / 2)
+            if move is not None:
+                return move
+            remain_time = max(MIN_SEARCH_TIME, deadline - time.time())
+        if self.workers > 1:
+            if self.parallel is None:
+                self.parallel = ParallelSearch(self.workers,
+                                               self.table_size_mb, self.n)
+            return self.parallel.search(temp, remain_time)[0]
+        if self.stats_path is None:
+            return alpha_beta_minimax(temp, remain_time, table=self.table,
+                                      orderer=self.orderer)
+        move, stats = alpha_beta_minimax(temp, remain_time, table=self.table,
+                                         orderer=self.orderer,
+                                         collect_stats=True)
+        self.write_stats(stats, empties, remain_time)
+        return move
+
+    def write_stats(self, stats, empties, time_limit):
+        """ Append the search_stats.SearchStats of a move to stats_path. """
+        stats.info.update({'n': self.n, 'empties': empties,
+                           'time_limit': time_limit,
+                           'tt_hit_rate': self.table.hit_rate()})
+        stats.write(self.stats_path)
 
     def run(self):
         
@@ -154,6 +180,9 @@ class Othello(Board):
             if self.is_legal_move(self.move):
                 turtle.onscreenclick(None)
                 self.make_move()
+                if self.ai and self.ponder and self.workers == 1:
+                    self.ponderer.start(StateHolder(self.board, 1),
+                                        self.stats_path is not None)
             else:
                 return
 
@@ -175,9 +204,15 @@ class Othello(Board):
 
         
         if not self.has_legal_move() or sum(self.num_tiles) == self.n ** 2:
+            self.ponderer.stop()
             turtle.onscreenclick(None)
             print('-----------')
             self.report_result()
+            if self.record_file is not None:
+                try:
+                    records.append_game(self.game, self.record_file)
+                except OSError:
+                    print('Error recording the game.')
             name = input('Enter your name for posterity\n')
             if not score.update_scores(name, self.num_tiles[0]):
                 print('Your score has not been saved.')
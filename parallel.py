@@ -0,0 +1,252 @@
+"""Lazy SMP: several processes search the same root and share one
+transposition table held in shared memory.
+
+The main process searches as usual while every helper process deepens
+the same root with its own start depth and root move order. They only
+talk through the shared table, so each benefits from the positions the
+others have already searched. The move played comes from whichever
+process finished the deepest iteration.
+"""
+
+import atexit
+import multiprocessing
+import queue
+import random
+import struct
+import time
+from multiprocessing import shared_memory
+
+from min_max_ai import (StateHolder, SearchContext, MAX_DEPTH,
+                        iterative_deepening, root_moves)
+from move_ordering import MoveOrderer
+from transposition import ENTRY_BYTES, DEFAULT_SIZE_MB
+import bitboard
+from weights import positional_weights
+
+DEFAULT_WORKERS = 1
+# Words per table entry: check, data, score bits.
+WORDS = 3
+# Seconds to wait for the helpers to report after the deadline.
+GRACE = 0.5
+
+_DOUBLE = struct.Struct('<d')
+_QWORD = struct.Struct('<Q')
+
+
+class SharedTranspositionTable:
+    """ TranspositionTable with its entries in a shared memory block.
+
+    Each entry is three 64-bit words: the key XORed with the other two, a
+    data word packing depth (8 bits), bound type (2), move plus one (16,
+    so squares 0 to 65534: boards up to 255 x 255) and generation (8),
+    and the score's bits. Writers never lock; a reader rebuilds the key
+    from the three words and ignores the entry if a concurrent write tore
+    it.
+    """
+
+    def __init__(self, size_mb=DEFAULT_SIZE_MB, name=None, size=None):
+        if name is None:
+            entries = max(1, int(size_mb * 1024 * 1024 / ENTRY_BYTES))
+            self.size = 1 << (entries.bit_length() - 1)
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=self.size * WORDS * 8)
+            self.owner = True
+        else:
+            self.size = size
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.mask = self.size - 1
+        self.words = self.shm.buf.cast('Q')
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def clear(self):
+        words = self.words
+        for i in range(len(words)):
+            words[i] = 0
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 0xff
+
+    def probe(self, key):
+        """ (depth, flag, score, move) stored for key, or None. """
+        self.probes += 1
+        words = self.words
+        i = (key & self.mask) * WORDS
+        data = words[i + 1]
+        bits = words[i + 2]
+        if not data & 0xff or words[i] ^ data ^ bits != key:
+            return None
+        self.hits += 1
+        return ((data & 0xff) - 1, (data >> 8) & 0x3,
+                _DOUBLE.unpack(_QWORD.pack(bits))[0],
+                ((data >> 10) & 0xffff) - 1)
+
+    def store(self, key, depth, flag, score, move):
+        words = self.words
+        i = (key & self.mask) * WORDS
+        old_data = words[i + 1]
+        if old_data & 0xff and \
+           words[i] ^ old_data ^ words[i + 2] != key:
+            if (old_data >> 26) & 0xff == self.generation and \
+               depth < (old_data & 0xff) - 1:
+                self.rejected += 1
+                return
+            self.overwrites += 1
+        self.stores += 1
+        bits = _QWORD.unpack(_DOUBLE.pack(score))[0]
+        data = (depth + 1) | (flag << 8) | ((move + 1) << 10) | \
+               (self.generation << 26)
+        words[i + 1] = data
+        words[i + 2] = bits
+        words[i] = key ^ data ^ bits
+
+    def hit_rate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def stats(self):
+        """ Counters of this process's probes and stores. """
+        return {'size': self.size, 'probes': self.probes,
+                'hits': self.hits, 'hit_rate': self.hit_rate(),
+                'stores': self.stores, 'overwrites': self.overwrites,
+                'rejected': self.rejected}
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _helper_main(worker, name, size, n, tasks, results, stop):
+    """ Body of a helper process: search every root it is sent. """
+    table = SharedTranspositionTable(name=name, size=size)
+    orderer = MoveOrderer(positional_weights(n))
+    geometry = bitboard.geometry(n)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        search_id, black, white, player, deadline, max_depth, \
+            generation = task
+        board = StateHolder(geometry.to_grid(black, white), player)
+        table.generation = generation
+        orderer.new_search()
+        context = SearchContext(deadline, table, orderer, stop=stop)
+
+        # Helpers differ from the main search in root order and, for odd
+        # workers, by starting one ply deeper.
+        moves = root_moves(board, context)
+        rest = moves[1:]
+        random.Random(worker * 7919 + search_id).shuffle(rest)
+        moves[1:] = rest
+
+        def report(depth, move, value):
+            results.put((search_id, worker, depth, move, value))
+
+        iterative_deepening(board, moves, context, max_depth,
+                            1 + worker % 2, report)
+        if time.time() < deadline and not stop.is_set():
+            # Reached max_depth before time ran out: nobody needs to go on.
+            stop.set()
+        results.put((search_id, worker, None, None, None))
+    table.close()
+
+
+class ParallelSearch:
+    """ Main-process side of Lazy SMP with workers - 1 helper processes.
+
+    The helpers and the shared table live until close(), so they are
+    reused from one move to the next. They search n x n boards.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS,
+                 table_size_mb=DEFAULT_SIZE_MB, n=bitboard.N):
+        self.workers = workers
+        self.table = SharedTranspositionTable(table_size_mb)
+        self.orderer = MoveOrderer(positional_weights(n))
+        self.stop = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.search_id = 0
+        self.helpers = []
+        for worker in range(1, workers):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_helper_main,
+                args=(worker, self.table.name, self.table.size, n, tasks,
+                      self.results, self.stop),
+                daemon=True)
+            process.start()
+            self.helpers.append((process, tasks))
+        atexit.register(self.close)
+
+    def search(self, board, time_limit, max_depth=MAX_DEPTH):
+        """ Best move for board, like min_max_ai.alpha_beta_minimax. Also
+        returns the depth it was searched to. """
+        moves = board.get_legal_moves()
+        if len(moves) == 1:
+            return moves[0], 0
+
+        self.search_id += 1
+        deadline = time.time() + time_limit
+        self.table.new_search()
+        self.orderer.new_search()
+        self.stop.clear()
+        task = (self.search_id, board.discs[0], board.discs[1],
+                board.current_player, deadline, max_depth,
+                self.table.generation)
+        for process, tasks in self.helpers:
+            tasks.put(task)
+
+        main_depth = [0]
+
+        def report(depth, move, value):
+            main_depth[0] = depth
+
+        context = SearchContext(deadline, self.table, self.orderer,
+                                len(board.history), stop=self.stop)
+        moves = root_moves(board, context)
+        first_move = moves[0]
+        main_move = iterative_deepening(board, moves, context, max_depth,
+                                        report=report)
+        self.stop.set()
+
+        best_depth, best_move = main_depth[0], main_move
+        waiting = len(self.helpers)
+        while waiting:
+            try:
+                search_id, worker, depth, move, value = \
+                    self.results.get(timeout=GRACE)
+            except queue.Empty:
+                break
+            if search_id != self.search_id:
+                continue
+            if depth is None:
+                waiting -= 1
+            elif depth > best_depth:
+                best_depth, best_move = depth, move
+
+        if best_move is None:
+            # No iteration finished anywhere: take the best ordered move.
+            best_move = first_move
+        return best_move, best_depth
+
+    def close(self):
+        if self.table is None:
+            return
+        for process, tasks in self.helpers:
+            tasks.put(None)
+        for process, tasks in self.helpers:
+            process.join(GRACE)
+            if process.is_alive():
+                process.terminate()
+        self.helpers = []
+        self.table.close()
+        self.table = None
@@ -0,0 +1,196 @@
+"""Pattern evaluation of 8 x 8 positions.
+
+Instead of weighing a few hand-made terms, the pattern evaluator looks
+up every line of squares in a table of values learnt from games. The
+board is covered by 46 instances of eleven patterns (the edges with
+their X squares, 2 x 5 and 3 x 3 corner blocks, the second to fourth
+rows, and the diagonals of four to eight squares), each rotated and
+mirrored to every place it fits. An instance's contents, read as a
+base-3 number (0 empty, 1 black, 2 white), index the pattern's table, so
+a position is worth the sum of 46 table entries: the table of its stage,
+one of STAGES bands of disc counts.
+
+min_max_ai.StateHolder keeps the 46 indices up to date as moves are made
+and taken back, once PatternEvaluator.prepare has been called on it:
+each square changed by a move adds or subtracts a power of three from
+the indices of the instances it belongs to. Evaluating a leaf is then
+46 lookups and a sum.
+
+The tables are fitted by tune.py --evaluator patterns and stored in
+patterns.bin next to this module: a 16-byte header (magic, number of
+stages, entries per stage, scale) and the zlib-compressed entries as
+16-bit integers, in 1 / scale discs for black.
+"""
+
+import array
+import os
+import struct
+import sys
+import zlib
+
+import bitboard
+
+PATTERN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'patterns.bin')
+MAGIC = b'OPT1'
+HEADER = struct.Struct('<4sIII')
+# Stages of the game, by the number of discs on the board.
+STAGES = 6
+# The patterns, as the squares (row, col) of one instance, in index order.
+PATTERNS = [
+    ('edge_x', [(0, c) for c in range(8)] + [(1, 1), (1, 6)]),
+    ('corner_2x5', [(r, c) for r in range(2) for c in range(5)]),
+    ('corner_3x3', [(r, c) for r in range(3) for c in range(3)]),
+    ('row_2', [(1, c) for c in range(8)]),
+    ('row_3', [(2, c) for c in range(8)]),
+    ('row_4', [(3, c) for c in range(8)]),
+    ('diagonal_8', [(i, i) for i in range(8)]),
+    ('diagonal_7', [(i, i + 1) for i in range(7)]),
+    ('diagonal_6', [(i, i + 2) for i in range(6)]),
+    ('diagonal_5', [(i, i + 3) for i in range(5)]),
+    ('diagonal_4', [(i, i + 4) for i in range(4)]),
+]
+
+
+def _images(squares):
+    """ The distinct images of a pattern instance under the eight
+    symmetries of the board, each as a tuple of square numbers. """
+    images = []
+    seen = set()
+    for transpose in (False, True):
+        for flip_rows in (False, True):
+            for flip_cols in (False, True):
+                image = []
+                for row, col in squares:
+                    if transpose:
+                        row, col = col, row
+                    if flip_rows:
+                        row = 7 - row
+                    if flip_cols:
+                        col = 7 - col
+                    image.append(bitboard.square(row, col))
+                if frozenset(image) not in seen:
+                    seen.add(frozenset(image))
+                    images.append(tuple(image))
+    return images
+
+
+def _instances():
+    """ (offset of the pattern's table, squares) of every instance, and
+    the number of table entries of a stage. """
+    instances = []
+    offset = 0
+    for name, squares in PATTERNS:
+        for image in _images(squares):
+            instances.append((offset, image))
+        offset += 3 ** len(squares)
+    return instances, offset
+
+
+INSTANCES, STAGE_SIZE = _instances()
+
+
+def stage(discs):
+    """ Stage of a position with discs discs on the board. """
+    return min(STAGES - 1, max(0, discs - 4) * STAGES // 60)
+
+
+class PatternEvaluator:
+    """ Leaf evaluator backed by pattern tables: use it as the evaluate
+    argument of the search. Its value is from the point of view of the
+    player to move, like board_value's. The tables are read from path
+    the first time they are needed. """
+
+    def __init__(self, path=PATTERN_PATH):
+        self.path = path
+        self.lookups = None
+        # For each player and square, the (instance, index change) pairs
+        # of a disc of that player placed on the square, and of one of
+        # the opponent's discs there flipped to that player.
+        self.place = [[[] for sq in range(64)] for player in range(2)]
+        self.flip = [[[] for sq in range(64)] for player in range(2)]
+        for i, (offset, squares) in enumerate(INSTANCES):
+            for k, sq in enumerate(squares):
+                power = 3 ** k
+                self.place[0][sq].append((i, power))
+                self.place[1][sq].append((i, 2 * power))
+                self.flip[0][sq].append((i, -power))
+                self.flip[1][sq].append((i, power))
+        self.stages = [stage(discs) for discs in range(65)]
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        magic, stages, size, scale = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or stages != STAGES or size != STAGE_SIZE:
+            raise ValueError('%s does not match these patterns' % self.path)
+        entries = array.array('h')
+        entries.frombytes(zlib.decompress(data[HEADER.size:]))
+        if sys.byteorder != 'little':
+            entries.byteswap()
+        self.scale = scale
+        self.lookups = [entries[s * size:(s + 1) * size].__getitem__
+                        for s in range(stages)]
+
+    def indices(self, black, white):
+        """ Table index of every instance, computed from scratch. """
+        indices = []
+        for offset, squares in INSTANCES:
+            index = 0
+            power = 1
+            for sq in squares:
+                index += power * ((black >> sq & 1) + 2 * (white >> sq & 1))
+                power *= 3
+            indices.append(offset + index)
+        return indices
+
+    def update(self, indices, sq, flips, player):
+        """ indices after player has put a disc on sq and flipped flips,
+        as a new list. """
+        indices = indices[:]
+        for i, change in self.place[player][sq]:
+            indices[i] += change
+        flip = self.flip[player]
+        while flips:
+            lsb = flips & -flips
+            for i, change in flip[lsb.bit_length() - 1]:
+                indices[i] += change
+            flips ^= lsb
+        return indices
+
+    def prepare(self, state):
+        """ Have state keep its indices up to date from now on. """
+        if state.n != bitboard.N:
+            raise ValueError('patterns only score 8 x 8 boards')
+        state.use_patterns(self)
+
+    def __call__(self, state):
+        if self.lookups is None:
+            self.load()
+        if state.patterns is self:
+            indices = state.pattern_indices
+        else:
+            indices = self.indices(state.discs[0], state.discs[1])
+        lookup = self.lookups[self.stages[state.counts[0] +
+                                          state.counts[1]]]
+        value = sum(map(lookup, indices))
+        return value if state.current_player == 0 else -value
+
+
+def write_patterns(path, tables, scale):
+    """ Write tables, a sequence of STAGES sequences of STAGE_SIZE values in
+    discs, as a pattern file. """
+    entries = array.array('h')
+    for table in tables:
+        if len(table) != STAGE_SIZE:
+            raise ValueError('a stage needs %d entries' % STAGE_SIZE)
+        entries.extend(max(-32767, min(32767, int(round(value * scale))))
+                       for value in table)
+    if sys.byteorder != 'little':
+        entries.byteswap()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(tables), STAGE_SIZE, scale))
+        f.write(zlib.compress(entries.tobytes(), 9))
+
+
+pattern_value = PatternEvaluator()
@@ -0,0 +1,117 @@
+"""Searching on the opponent's time.
+
+After the engine moves, a Ponderer keeps searching in a background
+thread until the opponent replies. If the search predicted the reply (the
+best move stored for the opponent in the transposition table), it
+searches the position after that reply, as if it were already the
+engine's turn; when that reply is played, finish() just gives the running
+search a deadline and takes its move. Otherwise it searches the
+opponent's position itself, which fills the table for every reply, and
+the next alpha_beta_minimax call with the same table and orderer finds
+much of its work already stored.
+
+The ponder search and the real search never run at the same time:
+finish() and stop() wait for the thread to end, and one of them must be
+called before the engine searches again.
+"""
+
+import copy
+import threading
+import time
+
+from min_max_ai import SearchContext, iterative_deepening, root_moves, \
+    MAX_DEPTH
+from search_stats import SearchStats
+
+
+class Ponderer:
+    """ Background search sharing a TranspositionTable and MoveOrderer with
+    the engine's own searches. """
+
+    def __init__(self, table, orderer, evaluate=None, max_depth=MAX_DEPTH):
+        self.table = table
+        self.orderer = orderer
+        self.evaluate = evaluate
+        self.max_depth = max_depth
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Search context and position key of the current ponder search,
+        # its best move (from the iteration it was in when it ended, or
+        # the first root move if none had one yet) and the depth of the
+        # last iteration it finished, its search_stats.SearchStats if it
+        # collects them, and the nodes of every ponder search so far.
+        self.context = None
+        self.key = None
+        self.move = None
+        self.depth = 0
+        self.stats = None
+        self.nodes = 0
+
+    def start(self, board, collect_stats=False):
+        """ Ponder on board, a StateHolder with the opponent to move. With
+        collect_stats, the search fills in a SearchStats, left in stats
+        once finish() has taken its move. """
+        self.stop()
+        board = copy.deepcopy(board)
+        entry = self.table.probe(board.hash)
+        if entry is not None and entry[3] >= 0 and \
+           board.get_move_mask() >> entry[3] & 1:
+            board.make_move(entry[3])
+            if not board.has_legal_move():
+                board.pass_turn()
+        if not board.has_legal_move():
+            return
+        self.key = board.hash
+        self.move = None
+        self.depth = 0
+        self.stats = SearchStats() if collect_stats else None
+        self.context = SearchContext(float('inf'), self.table, self.orderer,
+                                     len(board.history),
+                                     stop=self.stop_event,
+                                     evaluate=self.evaluate,
+                                     stats=self.stats)
+        if self.stats is not None:
+            self.context.get_moves = self.stats.timed_get_moves(
+                board.geometry.get_moves)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, args=(board,),
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, board):
+        context = self.context
+        stats = self.stats
+
+        def report(depth, move, value):
+            self.depth = depth
+            if stats is not None:
+                stats.record_iteration(depth, context.nodes)
+
+        moves = root_moves(board, context)
+        first_move = moves[0]
+        move = iterative_deepening(board, moves, context, self.max_depth,
+                                   report=report)
+        self.move = move if move is not None else first_move
+        self.nodes += context.nodes
+
+    def finish(self, board, time_limit):
+        """ Best move for board, the position the engine now has to move
+        in, if the ponder search is on it: the search goes on for up to
+        time_limit more seconds. Otherwise stop pondering and return
+        None. """
+        if self.thread is None or board.hash != self.key:
+            self.stop()
+            return None
+        self.context.deadline = time.time() + time_limit
+        self.thread.join()
+        self.thread = None
+        if self.stats is not None:
+            self.stats.finish(self.context.nodes, self.move)
+        return self.move
+
+    def stop(self):
+        """ End the ponder search, if any, and wait for it. """
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,166 @@
+"""Game records: every finished game as a compact move sequence.
+
+    python records.py [--file games.rec]
+        Print the number of games and positions in a record file.
+
+A record file is a 4-byte magic followed by one record per game: an
+8-byte header (number of moves, board size, player who moved first,
+final black and white disc counts) and then the squares played, one byte
+each (two on boards of more than 16 x 16). Passes are not stored: replay
+passes whenever the player to move has no legal move, as the rules do.
+
+append_game writes a whole record with one write to a file opened for
+appending, so games finished by several processes at once do not mix; a
+new file gets its magic before any process can open it (create_file).
+RecordReader maps the file read-only with mmap and walks it lazily, so
+millions of games can be replayed without reading the file into memory.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+
+import bitboard
+
+RECORD_FILE = 'games.rec'
+MAGIC = b'OGR1'
+# Moves, board size, first player, black discs, white discs.
+HEADER = struct.Struct('<HBBHH')
+
+
+def move_width(n):
+    """ Bytes per move on an n x n board. """
+    return 1 if n * n <= 256 else 2
+
+
+def encode_game(n, first_player, moves, discs):
+    """ Record of a game: moves are the squares (row, col) played, in
+    order, and discs the final (black, white) counts. """
+    geometry = bitboard.geometry(n)
+    squares = [geometry.square(row, col) for row, col in moves]
+    if move_width(n) == 1:
+        body = bytes(squares)
+    else:
+        body = struct.pack('<%dH' % len(squares), *squares)
+    return HEADER.pack(len(squares), n, first_player, discs[0],
+                       discs[1]) + body
+
+
+def create_file(filename=RECORD_FILE):
+    """ Create an empty record file, holding only the magic, unless the
+    file already exists. The magic is written to a file of its own that
+    is then linked to filename, so no other process ever sees the file
+    without it. """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp = tempfile.mkstemp(dir=directory)
+    try:
+        os.write(fd, MAGIC)
+        os.close(fd)
+        os.chmod(temp, 0o644)
+        try:
+            os.link(temp, filename)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temp)
+
+
+def append_game(game, filename=RECORD_FILE):
+    """ Append a finished game.Game to a record file, creating it if
+    needed. """
+    data = encode_game(game.n, game.first_player, game.moves,
+                       game.num_tiles)
+    if not os.path.exists(filename):
+        create_file(filename)
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+class RecordReader:
+    """ Read-only view of a record file. """
+
+    def __init__(self, filename=RECORD_FILE):
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # An empty file cannot be mapped; it simply has no games.
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if size else b''
+        if self.map and self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('%s is not a game record file' % filename)
+
+    def __iter__(self):
+        """ (n, first player, squares, black discs, white discs) of every
+        game, squares as a list of square numbers. A record cut short by
+        a write still going on is left out. """
+        data = self.map
+        offset = len(MAGIC)
+        while offset + HEADER.size <= len(data):
+            count, n, first_player, black, white = \
+                HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            width = move_width(n)
+            end = offset + count * width
+            if end > len(data):
+                break
+            if width == 1:
+                squares = list(data[offset:end])
+            else:
+                squares = list(struct.unpack_from('<%dH' % count, data,
+                                                  offset))
+            offset = end
+            yield n, first_player, squares, black, white
+
+    def positions(self):
+        """ Every position of every game, as (n, black, white, player to
+        move, final black discs, final white discs), before each move. """
+        for n, player, squares, black_final, white_final in self:
+            geometry = bitboard.geometry(n)
+            a = n // 2 - 1
+            b = n // 2
+            discs = [(1 << geometry.square(a, b)) |
+                     (1 << geometry.square(b, a)),
+                     (1 << geometry.square(a, a)) |
+                     (1 << geometry.square(b, b))]
+            get_flips = geometry.get_flips
+            for sq in squares:
+                own = discs[player]
+                opp = discs[1 - player]
+                flips = get_flips(own, opp, sq)
+                if not flips:
+                    # The recorded move is not this player's: pass.
+                    player = 1 - player
+                    own, opp = opp, own
+                    flips = get_flips(own, opp, sq)
+                yield n, discs[0], discs[1], player, black_final, \
+                    white_final
+                discs[player] = own | flips | (1 << sq)
+                discs[1 - player] = opp ^ flips
+                player = 1 - player
+
+    def close(self):
+        if self.map:
+            self.map.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Othello game records')
+    parser.add_argument('--file', default=RECORD_FILE)
+    args = parser.parse_args()
+    reader = RecordReader(args.file)
+    games = 0
+    positions = 0
+    for record in reader:
+        games += 1
+        positions += len(record[2])
+    reader.close()
+    print('%d games, %d positions' % (games, positions))
+
+
+if __name__ == '__main__':
+    main()
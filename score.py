@@ -1,8 +1,59 @@
+"""High scores, kept in an SQLite database.
 
+Scores are only ever inserted, one transaction per call, and the database
+runs in WAL mode, so any number of game processes can record scores at
+once while others read. Indexes on the score and on (name, score) let
+top_scores and best_score answer without scanning the history, and an
+insert costs O(log n) however many scores there are.
+
+The first time the database is opened, the scores of an old scores.txt
+next to it are copied in.
+"""
+
+import os
+import sqlite3
+import time
+
+SCORE_DB = 'scores.db'
 SCORE_FILE = 'scores.txt'
+# Seconds to wait for another process's write to finish.
+BUSY_TIMEOUT = 10.0
+SCHEMA_VERSION = 1
+
+def connect(filename=SCORE_DB):
+    """ Open the database, creating it if needed. """
+    db = sqlite3.connect(filename, timeout=BUSY_TIMEOUT)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    if db.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        with db:
+            # Take the write lock before looking at the version again, so
+            # that a single process creates the tables and imports the old
+            # scores, and the others find the work done.
+            db.execute('BEGIN IMMEDIATE')
+            version = db.execute('PRAGMA user_version').fetchone()[0]
+            if version < SCHEMA_VERSION:
+                db.execute('CREATE TABLE IF NOT EXISTS scores ('
+                           'id INTEGER PRIMARY KEY, name TEXT NOT NULL, '
+                           'score INTEGER NOT NULL, time REAL NOT NULL)')
+                db.execute('CREATE INDEX IF NOT EXISTS scores_by_score '
+                           'ON scores (score DESC, id)')
+                db.execute('CREATE INDEX IF NOT EXISTS scores_by_name '
+                           'ON scores (name, score DESC)')
+                if version == 0:
+                    text_file = os.path.join(os.path.dirname(filename),
+                                             SCORE_FILE)
+                    insert(db, parse_scores(read_scores(text_file) or ''))
+                db.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+    return db
+
+def insert(db, records):
+    now = time.time()
+    db.executemany('INSERT INTO scores (name, score, time) VALUES (?, ?, ?)',
+                   [(name, score, now) for name, score in records])
 
 def read_scores(filename=SCORE_FILE):
-    
+    """ Text of an old scores file, '' if there is none. """
     try:
         infile = open(filename, 'r')
         data = infile.read()
@@ -13,44 +64,61 @@ def read_scores(filename=SCORE_FILE):
     except OSError:
         print('Error reading the score file.')
         return
-    
-def write_scores(new_data, filename=SCORE_FILE, mode='a'):
-   
+
+def parse_scores(data):
+    """ (name, score) records of scores file text, skipping bad lines. """
+    records = []
+    for line in data.splitlines():
+        name, _, score = line.rpartition(' ')
+        try:
+            records.append((name, int(score)))
+        except ValueError:
+            continue
+    return records
+
+def add_scores(records, filename=SCORE_DB):
+    """ Insert (name, score) records in one transaction. Returns the
+    number inserted, 0 on error. """
+    records = list(records)
     try:
-        outfile = open(filename, mode)
-        outfile.write(new_data)
-        outfile.close()
-    except OSError:
-        print('Error updating the score file.')
-        return ''
+        db = connect(filename)
+        try:
+            with db:
+                insert(db, records)
+        finally:
+            db.close()
+    except sqlite3.Error:
+        print('Error updating the score database.')
+        return 0
+    return len(records)
 
-def update_scores(name, score, filename=SCORE_FILE):
-   
+def update_scores(name, score, filename=SCORE_DB):
+    """ Record a score; returns 'name score', or '' if it could not be
+    saved. """
     new_record = name + ' ' + str(score)
-    new_data = new_record + '\n'
-    scores_data = read_scores(filename)
-
-    if scores_data == None:
+    if add_scores([(name, score)], filename) == 0:
         return ''
+    return new_record
 
-    if scores_data:
-        records = scores_data.splitlines()
-        high_scorer = records[0].rsplit(' ', 1)
-        try:
-            highest_score = int(high_scorer[1])
-            if score > highest_score:
-                scores_data = new_data + scores_data
-                if write_scores(scores_data, filename, 'w') == '':
-                    return ''
-                else:
-                    return new_record
-        except ValueError:
-            print('Unknown format for the score file.')
-            return ''
-        if scores_data[-1] != '\n':
-            new_data = '\n' + new_data
-    
-    if write_scores(new_data, filename) == '':
-        return ''
-    else:
-        return new_record
+def top_scores(k=10, filename=SCORE_DB):
+    """ The k best (name, score) records, best first; ties in the order
+    they were set. """
+    db = connect(filename)
+    try:
+        return db.execute('SELECT name, score FROM scores '
+                          'ORDER BY score DESC, id LIMIT ?', (k,)).fetchall()
+    finally:
+        db.close()
+
+def best_score(name, filename=SCORE_DB):
+    """ Best score of a player, or None if they have none. """
+    db = connect(filename)
+    try:
+        return db.execute('SELECT MAX(score) FROM scores WHERE name = ?',
+                          (name,)).fetchone()[0]
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    for name, score in top_scores():
+        print('%6d  %s' % (score, name))
@@ -0,0 +1,110 @@
+"""Statistics of one alpha_beta_minimax call.
+
+Collection is off unless asked for: the search only looks at
+SearchContext.stats, which is None by default. When it is a SearchStats,
+leaf evaluation and move generation go through timing wrappers and cutoffs
+are counted, and alpha_beta_minimax returns the stats with the move.
+
+as_dict() gives everything as plain values and write() appends it to a
+file as one JSON line, so runs can be collected and compared across
+versions and machines.
+"""
+
+import json
+import platform
+import socket
+import time
+
+
+class SearchStats:
+    """ Counters and timings filled in by the search. """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.nodes = 0
+        self.leaves = 0
+        # Nodes whose moves were searched, and how many of them ended in a
+        # beta cutoff, on the first move tried or on any.
+        self.expanded = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+        # (depth, seconds since the start, nodes so far) of every
+        # iteration finished.
+        self.iterations = []
+        self.move = None
+        # Extra fields for the JSON record, set by the caller.
+        self.info = {}
+
+    def timed_evaluate(self, evaluate):
+        """ evaluate, counting leaves and the time spent in it. """
+        clock = time.perf_counter
+
+        def timed(state):
+            start = clock()
+            value = evaluate(state)
+            self.eval_time += clock() - start
+            self.leaves += 1
+            return value
+        return timed
+
+    def timed_get_moves(self, get_moves):
+        """ get_moves, counting the time spent in it. """
+        clock = time.perf_counter
+
+        def timed(own, opp):
+            start = clock()
+            moves = get_moves(own, opp)
+            self.movegen_time += clock() - start
+            return moves
+        return timed
+
+    def record_cutoff(self, first_move):
+        self.cutoffs += 1
+        if first_move:
+            self.first_move_cutoffs += 1
+
+    def record_iteration(self, depth, nodes):
+        self.iterations.append((depth, time.perf_counter() - self.start,
+                                nodes))
+
+    def finish(self, nodes, move):
+        self.elapsed = time.perf_counter() - self.start
+        self.nodes = nodes
+        self.move = move
+
+    def depth(self):
+        """ Depth of the deepest iteration finished. """
+        return self.iterations[-1][0] if self.iterations else 0
+
+    def as_dict(self):
+        def ratio(a, b):
+            return a / b if b else 0.0
+
+        record = {
+            'time': time.time(),
+            'host': socket.gethostname(),
+            'python': platform.python_version(),
+            'move': self.move,
+            'elapsed': self.elapsed,
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'nps': ratio(self.nodes, self.elapsed),
+            'depth': self.depth(),
+            'iterations': [{'depth': depth, 'time': at, 'nodes': nodes}
+                           for depth, at, nodes in self.iterations],
+            'cutoff_rate': ratio(self.cutoffs, self.expanded),
+            'first_move_cutoff_ratio': ratio(self.first_move_cutoffs,
+                                             self.cutoffs),
+            'movegen_time': self.movegen_time,
+            'eval_time': self.eval_time,
+        }
+        record.update(self.info)
+        return record
+
+    def write(self, path):
+        """ Append the stats to path as one JSON line. """
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.as_dict()) + '\n')
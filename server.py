@@ -0,0 +1,385 @@
+"""Engine server: many games at once over a line protocol.
+
+    python server.py [--port P | --unix PATH | --stdin] [--workers N]
+
+Clients connect to a local TCP port or Unix socket (or write to stdin)
+and send one command per line. Every command starts with a game id of the
+client's choosing, and every reply starts with the same id, so one
+connection can run any number of games and replies to searches can come
+back in any order:
+
+    <id> new [n]                start a game on an n x n board (default 8)
+    <id> position <cells> <x|o> set the board, row by row as n * n
+                                characters of x (black), o (white) and -,
+                                and the side to move
+    <id> move <square|pass>     play a move, e.g. 'd3'
+    <id> go <seconds>           search for at most seconds and play the
+                                move found; replies '<id> bestmove <square>'
+                                or '<id> bestmove pass'
+    <id> show                   reply '<id> position <cells> <x|o>'
+    <id> end                    forget the game
+    stats                       reply 'stats games G searching S queued Q'
+
+Other replies are '<id> ok', '<id> gameover <black discs> <white discs>'
+after the move that ends a game, and '<id> error <message>'.
+
+A game is a Session of two bitboards and the side to move, so an idle
+game costs a few hundred bytes. Searches go to a pool of worker
+processes, at most one per worker at a time; the rest wait their turn in
+the event loop, and the wait counts against their time. Each worker keeps
+a transposition table and move statistics per board size, shared by the
+games it searches, and uses the opening book and the endgame solver on
+8 x 8 boards like the turtle front end.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import sys
+import time
+
+import bitboard
+import book
+from endgame import EndgameSolver, DEFAULT_EMPTIES
+from game import format_move, parse_move
+from min_max_ai import StateHolder, alpha_beta_minimax
+from move_ordering import MoveOrderer
+from transposition import TranspositionTable, DEFAULT_SIZE_MB
+from weights import positional_weights
+
+DEFAULT_PORT = 7878
+MAX_N = 26
+# Shortest search given to a move whose time ran out while it waited for
+# a worker.
+MIN_TIME = 0.05
+CELLS = '-xo'
+
+
+class Session:
+    """ One game: the board as bitboards and the player to move. """
+
+    __slots__ = ('n', 'black', 'white', 'player', 'busy')
+
+    def __init__(self, n=bitboard.N):
+        self.n = n
+        geometry = bitboard.geometry(n)
+        a = n // 2 - 1
+        b = n // 2
+        self.black = (1 << geometry.square(a, b)) | \
+            (1 << geometry.square(b, a))
+        self.white = (1 << geometry.square(a, a)) | \
+            (1 << geometry.square(b, b))
+        self.player = 0
+        # True while a search of this game is queued or running.
+        self.busy = False
+
+    def discs(self):
+        """ (own, opp) bitboards of the player to move. """
+        if self.player == 0:
+            return self.black, self.white
+        return self.white, self.black
+
+    def moves(self):
+        return bitboard.geometry(self.n).get_moves(*self.discs())
+
+    def is_over(self):
+        own, opp = self.discs()
+        get_moves = bitboard.geometry(self.n).get_moves
+        return not get_moves(own, opp) and not get_moves(opp, own)
+
+    def play(self, sq):
+        """ Play square sq, or pass if sq is -1; raise ValueError if that
+        is not legal. """
+        moves = self.moves()
+        if sq < 0:
+            if moves:
+                raise ValueError('pass with legal moves')
+            if self.is_over():
+                raise ValueError('game over')
+        else:
+            if not moves >> sq & 1:
+                raise ValueError('illegal move')
+            own, opp = self.discs()
+            flips = bitboard.geometry(self.n).get_flips(own, opp, sq)
+            own |= flips | (1 << sq)
+            opp ^= flips
+            if self.player == 0:
+                self.black, self.white = own, opp
+            else:
+                self.white, self.black = own, opp
+        self.player = 1 - self.player
+
+    def set_position(self, cells, side):
+        n = self.n
+        if len(cells) != n * n or set(cells) - set(CELLS) or \
+           side not in ('x', 'o'):
+            raise ValueError('bad position')
+        self.black = self.white = 0
+        for sq, cell in enumerate(cells):
+            if cell == 'x':
+                self.black |= 1 << sq
+            elif cell == 'o':
+                self.white |= 1 << sq
+        self.player = 0 if side == 'x' else 1
+
+    def position(self):
+        cells = ''.join(CELLS[(self.black >> sq & 1) +
+                              2 * (self.white >> sq & 1)]
+                        for sq in range(self.n * self.n))
+        return '%s %s' % (cells, 'xo'[self.player])
+
+
+_table_size_mb = DEFAULT_SIZE_MB
+_searchers = {}
+_book = None
+_endgame = None
+
+
+def _init_worker(table_size_mb):
+    global _table_size_mb, _book, _endgame
+    _table_size_mb = table_size_mb
+    _book = book.open_book()
+    _endgame = EndgameSolver()
+
+
+def search_move(task):
+    """ Pool task: square to play, or -1 to pass, for a position given as
+    (n, black, white, player, deadline). """
+    n, black, white, player, deadline = task
+    geometry = bitboard.geometry(n)
+    state = StateHolder(geometry.to_grid(black, white), player)
+    if not state.has_legal_move():
+        return -1
+    if n not in _searchers:
+        _searchers[n] = (TranspositionTable(_table_size_mb),
+                         MoveOrderer(positional_weights(n)))
+    table, orderer = _searchers[n]
+    time_limit = max(MIN_TIME, deadline - time.time())
+    if n == bitboard.N:
+        move = _book.lookup(state) if _book is not None else None
+        if move is not None:
+            return geometry.square(*move)
+        empties = n * n - bitboard.popcount(black | white)
+        if empties <= DEFAULT_EMPTIES:
+            deadline = time.time() + time_limit
+            move = _endgame.best_move(state, deadline - time_limit / 2)
+            if move is not None:
+                return geometry.square(*move)
+            time_limit = max(MIN_TIME, deadline - time.time())
+    move = alpha_beta_minimax(state, time_limit, table=table,
+                              orderer=orderer)
+    return geometry.square(*move)
+
+
+class Server:
+    """ Sessions of every connection and the worker pool they share. """
+
+    def __init__(self, workers=None, table_size_mb=DEFAULT_SIZE_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, initializer=_init_worker,
+            initargs=(table_size_mb,))
+        self.slots = None
+        self.games = 0
+        # Searches asked for and not answered, and those of them running.
+        self.pending = 0
+        self.searching = 0
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def serve(self, reader, send):
+        """ Run the commands read from reader, replying through
+        send(line), until the end of input and of the searches asked
+        for. """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.workers)
+        sessions = {}
+        searches = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    text = line.decode().strip()
+                except UnicodeDecodeError:
+                    send('error bad encoding')
+                    continue
+                if text:
+                    self.command(text, sessions, searches, send)
+            # Answer the searches already asked for before closing.
+            if searches:
+                await asyncio.wait(list(searches))
+        finally:
+            for search in searches:
+                search.cancel()
+            self.games -= len(sessions)
+
+    def command(self, text, sessions, searches, send):
+        words = text.split()
+        if words == ['stats']:
+            send('stats games %d searching %d queued %d'
+                 % (self.games, self.searching,
+                    self.pending - self.searching))
+            return
+        if len(words) < 2:
+            send('error expected: <id> <command> ...')
+            return
+        name, verb, args = words[0], words[1], words[2:]
+        try:
+            if verb == 'new':
+                n = int(args[0]) if args else bitboard.N
+                if n < 4 or n > MAX_N or n % 2:
+                    raise ValueError('board size must be even, 4 to %d'
+                                     % MAX_N)
+                old = sessions.get(name)
+                if old is not None and old.busy:
+                    raise ValueError('busy')
+                if old is None:
+                    self.games += 1
+                sessions[name] = Session(n)
+                send('%s ok' % name)
+                return
+            session = sessions.get(name)
+            if session is None:
+                raise ValueError('no such game')
+            if session.busy:
+                raise ValueError('busy')
+            if verb == 'end':
+                del sessions[name]
+                self.games -= 1
+                send('%s ok' % name)
+            elif verb == 'show':
+                send('%s position %s' % (name, session.position()))
+            elif verb == 'position':
+                if len(args) != 2:
+                    raise ValueError('expected: position <cells> <x|o>')
+                session.set_position(args[0].lower(), args[1].lower())
+                send('%s ok' % name)
+            elif verb == 'move':
+                if len(args) != 1:
+                    raise ValueError('expected: move <square|pass>')
+                session.play(self.parse_square(session, args[0]))
+                send('%s ok' % name)
+                self.report_end(name, session, send)
+            elif verb == 'go':
+                time_limit = float(args[0]) if args else 1.0
+                if session.is_over():
+                    raise ValueError('game over')
+                session.busy = True
+                search = asyncio.ensure_future(
+                    self.go(name, session, time_limit, send))
+                self.pending += 1
+                searches.add(search)
+                search.add_done_callback(lambda s: self.search_done(
+                    s, searches))
+            else:
+                raise ValueError('unknown command: %s' % verb)
+        except (ValueError, IndexError) as e:
+            send('%s error %s' % (name, e))
+
+    def search_done(self, search, searches):
+        self.pending -= 1
+        searches.discard(search)
+
+    def parse_square(self, session, text):
+        if text.lower() == 'pass':
+            return -1
+        row, col = parse_move(text)
+        if not (0 <= row < session.n and 0 <= col < session.n):
+            raise ValueError('bad square: %s' % text)
+        return bitboard.geometry(session.n).square(row, col)
+
+    async def go(self, name, session, time_limit, send):
+        deadline = time.time() + time_limit
+        task = (session.n, session.black, session.white, session.player,
+                deadline)
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+        self.searching += 1
+        try:
+            sq = await loop.run_in_executor(self.pool, search_move, task)
+        finally:
+            self.searching -= 1
+            self.slots.release()
+            session.busy = False
+        session.play(sq)
+        move = 'pass' if sq < 0 else \
+            format_move(bitboard.geometry(session.n).coord(sq))
+        send('%s bestmove %s' % (name, move))
+        self.report_end(name, session, send)
+
+    def report_end(self, name, session, send):
+        if session.is_over():
+            send('%s gameover %d %d' % (name, bitboard.popcount(session.black),
+                                        bitboard.popcount(session.white)))
+
+
+async def serve_stream(server, reader, writer):
+    def send(line):
+        if not writer.is_closing():
+            writer.write((line + '\n').encode())
+
+    try:
+        await server.serve(reader, send)
+    finally:
+        writer.close()
+
+
+async def serve_stdin(server):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                 sys.stdin)
+
+    def send(line):
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+    await server.serve(reader, send)
+
+
+async def main_async(args):
+    server = Server(args.workers, args.table)
+    try:
+        if args.stdin:
+            await serve_stdin(server)
+            return
+        handler = lambda r, w: serve_stream(server, r, w)
+        if args.unix:
+            listener = await asyncio.start_unix_server(handler, args.unix)
+            where = args.unix
+        else:
+            listener = await asyncio.start_server(handler, '127.0.0.1',
+                                                  args.port)
+            where = '127.0.0.1:%d' % args.port
+        print('serving on %s with %d workers' % (where, server.workers),
+              file=sys.stderr)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Othello engine server')
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--port', type=int, default=DEFAULT_PORT)
+    where.add_argument('--unix', help='Unix socket path to listen on')
+    where.add_argument('--stdin', action='store_true',
+                       help='read commands from stdin, reply on stdout')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='search processes (default: one per CPU)')
+    parser.add_argument('--table', type=float, default=DEFAULT_SIZE_MB,
+                        help='transposition table MB per worker and size')
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
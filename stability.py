@@ -0,0 +1,262 @@
+"""Stable discs: discs that can never be flipped, whatever is played.
+
+A disc can only be flipped along one of the four lines through it (its
+row, its column and its two diagonals). It is stable when no line can
+ever outflank it: along each line the line is full, or the disc is on
+the edge of the board in that direction, or it touches a stable disc of
+its own colour. stable_discs finds them from the edges inwards:
+
+    * the discs of each edge that no sequence of moves along the edge
+      can flip are read from EDGE_TABLE, worked out once for all 3^8
+      contents of an edge (an edge disc cannot be flipped any other way);
+    * the rows, columns and diagonals without an empty square are found
+      by testing each line's mask;
+    * then every disc all of whose four lines are covered becomes
+      stable, over and over until no disc is added.
+
+This finds a subset of the stable discs, never a disc that can still be
+flipped, so it is safe to bound the final score with. A position with no
+corner taken is taken to have none, which skips the work for most of
+the game at the price of the rare stable disc found without a corner.
+The edge table is for 8 x 8 boards; on other sizes the propagation starts
+from the corners alone, which it finds stable by itself.
+"""
+
+import bitboard
+
+# Base-3 index of each 8-bit line of one colour: bit i is worth 3 ** i.
+BASE3 = [sum(3 ** i for i in range(8) if bits >> i & 1)
+         for bits in range(256)]
+# The squares of column 0, and the column holding each 8-bit line.
+A_FILE = 0x0101010101010101
+COLUMN_MAGIC = 0x0102040810204080
+COLUMNS = [sum(1 << (8 * i) for i in range(8) if bits >> i & 1)
+           for bits in range(256)]
+
+
+def _line_flips(own, opp, sq):
+    """ Discs of opp flipped along an 8-square line when own plays on sq. """
+    flips = 0
+    for step in (1, -1):
+        run = 0
+        i = sq + step
+        while 0 <= i < 8 and opp >> i & 1:
+            run |= 1 << i
+            i += step
+        if run and 0 <= i < 8 and own >> i & 1:
+            flips |= run
+    return flips
+
+
+def _edge_table():
+    """ Stable discs of every edge, indexed by BASE3[x] + 2 * BASE3[o] for
+    the discs x and o of the two colours. """
+    table = [0] * 3 ** 8
+    memo = {}
+
+    def stable(x, o):
+        key = x << 8 | o
+        if key in memo:
+            return memo[key]
+        result = x | o
+        empty = ~result & 0xff
+        # A disc is stable if no move flips it and it is stable after
+        # every move. Any empty square may be played by either colour, as
+        # a move that flips nothing here may be legal through another
+        # line.
+        while empty and result:
+            bit = empty & -empty
+            empty ^= bit
+            sq = bit.bit_length() - 1
+            flips = _line_flips(x, o, sq)
+            result &= ~flips & stable(x | flips | bit, o ^ flips)
+            flips = _line_flips(o, x, sq)
+            result &= ~flips & stable(x ^ flips, o | flips | bit)
+        memo[key] = result
+        return result
+
+    for x in range(256):
+        for o in range(256):
+            if not x & o:
+                table[BASE3[x] + 2 * BASE3[o]] = stable(x, o)
+    return table
+
+
+EDGE_TABLE = _edge_table()
+
+
+def _edge_stable(a, b):
+    """ Discs on the four edges of an 8 x 8 board stable along their
+    edge. """
+    table = EDGE_TABLE
+    stable = table[BASE3[a & 0xff] + 2 * BASE3[b & 0xff]]
+    stable |= table[BASE3[a >> 56] + 2 * BASE3[b >> 56]] << 56
+    full = bitboard.FULL
+    column_a = ((a & A_FILE) * COLUMN_MAGIC & full) >> 56
+    column_b = ((b & A_FILE) * COLUMN_MAGIC & full) >> 56
+    stable |= COLUMNS[table[BASE3[column_a] + 2 * BASE3[column_b]]]
+    column_a = ((a >> 7 & A_FILE) * COLUMN_MAGIC & full) >> 56
+    column_b = ((b >> 7 & A_FILE) * COLUMN_MAGIC & full) >> 56
+    stable |= COLUMNS[table[BASE3[column_a] + 2 * BASE3[column_b]]] << 7
+    return stable
+
+
+class Stability:
+    """ Line masks of an n x n board for stable_discs. """
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        full = geometry.full
+        # Per direction: the shift and the masks of the discs that can
+        # step towards higher and towards lower squares; and the squares
+        # with a neighbour on one side at most.
+        self.steps = []
+        self.edges = []
+        # Per direction, (shift, squares with no square that far above
+        # them on their line, squares with none that far below) for
+        # distances of 1, 2, 4, ... squares along the line.
+        self.doublings = []
+        for (shift, up), (_, down) in zip(geometry.left_steps,
+                                          geometry.right_steps):
+            # Squares with a neighbour below them, and with one on both
+            # sides, on their line in this direction.
+            below = ((full & up) << shift) & full
+            above = ((full & down) >> shift) & full
+            self.steps.append((shift, up, down))
+            self.edges.append(full & ~(below & above))
+            doublings = []
+            distance = 1
+            while distance < geometry.n:
+                # Squares with a square distance below them, and with
+                # one distance above them.
+                far_below = full
+                far_above = full
+                for i in range(distance):
+                    far_below = ((far_below & up) << shift) & full
+                    far_above = ((far_above & down) >> shift) & full
+                doublings.append((distance * shift, full & ~far_above,
+                                  full & ~far_below))
+                distance += distance
+            self.doublings.append(doublings)
+
+    def full_lines(self, filled):
+        """ For each direction, the squares whose line in that direction
+        has no empty square. filled may also be a NumPy array of uint64
+        bitboards. """
+        if self.geometry.n == bitboard.N:
+            # Rows and columns at once: a bit is left where the eight
+            # squares from it on are filled.
+            rows = filled & filled >> 1
+            rows &= rows >> 2
+            rows &= rows >> 4
+            columns = filled & filled >> 8
+            columns &= columns >> 16
+            columns &= columns >> 32
+            result = [(rows & A_FILE) * 0xff, (columns & 0xff) * A_FILE]
+            diagonals = self.doublings[2:]
+        else:
+            result = []
+            diagonals = self.doublings
+        for doublings in diagonals:
+            # Filled squares whose line is filled from them upwards, and
+            # downwards, for twice as many squares at each step.
+            up = down = filled
+            for distance, top, bottom in doublings:
+                up = up & (up >> distance | top)
+                down = down & (down << distance | bottom)
+            result.append(up & down)
+        return result
+
+    def covered(self, a, b):
+        """ Where stable discs start from, for the bitboards a and b of the
+        two players: (the discs found stable straight away, and for each
+        direction the squares that cannot be outflanked along it without
+        help from a neighbour), or None if a and b hold no corner. """
+        filled = a | b
+        if not filled & self.geometry.corners:
+            return None
+        edge0, edge1, edge2, edge3 = self.edges
+        if self.geometry.n != bitboard.N:
+            full0, full1, full2, full3 = self.full_lines(filled)
+            covered = (full0 | edge0, full1 | edge1, full2 | edge2,
+                       full3 | edge3)
+            return covered[0] & covered[1] & covered[2] & covered[3], \
+                covered
+        # full_lines unrolled for the 8 x 8 board, which every leaf with a
+        # corner taken gets here.
+        rows = filled & filled >> 1
+        rows &= rows >> 2
+        rows &= rows >> 4
+        columns = filled & filled >> 8
+        columns &= columns >> 16
+        columns &= columns >> 32
+        covered0 = (rows & A_FILE) * 0xff | edge0
+        covered1 = (columns & 0xff) * A_FILE | edge1
+        up = down = filled
+        for distance, top, bottom in self.doublings[2]:
+            up = up & (up >> distance | top)
+            down = down & (down << distance | bottom)
+        covered2 = up & down | edge2
+        up = down = filled
+        for distance, top, bottom in self.doublings[3]:
+            up = up & (up >> distance | top)
+            down = down & (down << distance | bottom)
+        covered3 = up & down | edge3
+        seeds = _edge_stable(a, b) | \
+            covered0 & covered1 & covered2 & covered3
+        return seeds, (covered0, covered1, covered2, covered3)
+
+    def spread(self, seeds, covered, *players):
+        """ Stable discs of each of players, bitboards of one player's
+        discs, grown from seeds: a disc is added when along each direction
+        it is covered or next to a stable disc of its own. """
+        (s0, up0, down0), (s1, up1, down1), (s2, up2, down2), \
+            (s3, up3, down3) = self.steps
+        covered0, covered1, covered2, covered3 = covered
+        result = []
+        for discs in players:
+            stable = discs & seeds
+            while stable:
+                new = discs & \
+                    (covered0 | (stable & up0) << s0 |
+                     (stable & down0) >> s0) & \
+                    (covered1 | (stable & up1) << s1 |
+                     (stable & down1) >> s1) & \
+                    (covered2 | (stable & up2) << s2 |
+                     (stable & down2) >> s2) & \
+                    (covered3 | (stable & up3) << s3 |
+                     (stable & down3) >> s3)
+                new |= stable
+                if new == stable:
+                    break
+                stable = new
+            result.append(stable)
+        return result
+
+    def stable_discs(self, a, b):
+        """ (stable discs of a, stable discs of b) for the bitboards a and
+        b of the two players. """
+        start = self.covered(a, b)
+        if start is None:
+            return 0, 0
+        stable_a, stable_b = self.spread(start[0], start[1], a, b)
+        return stable_a, stable_b
+
+    def stable(self, a, b):
+        """ Stable discs of a alone. """
+        start = self.covered(a, b)
+        if start is None:
+            return 0
+        return self.spread(start[0], start[1], a)[0]
+
+
+_stabilities = {}
+
+
+def stability(geometry):
+    """ The shared Stability of a bitboard.Geometry. """
+    n = geometry.n
+    if n not in _stabilities:
+        _stabilities[n] = Stability(geometry)
+    return _stabilities[n]
+
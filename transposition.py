@@ -0,0 +1,135 @@
+"""Zobrist hashing and the transposition table used by the search.
+
+The keys come from a fixed seed, so a position hashes to the same value
+in every process and on every run.
+"""
+
+import random
+
+ZOBRIST_SEED = 20240607
+SQUARES = 64
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Rough size of one filled entry: five list slots plus the key and score
+# objects they point to.
+ENTRY_BYTES = 100
+DEFAULT_SIZE_MB = 16
+
+
+def _make_keys(seed, squares=SQUARES):
+    rng = random.Random(seed)
+    discs = [[rng.getrandbits(64) for sq in range(squares)]
+             for player in range(2)]
+    return discs, rng.getrandbits(64)
+
+
+# ZOBRIST[player][sq] marks a disc of player on sq; SIDE_KEY is XORed in
+# while player 1 is to move.
+ZOBRIST, SIDE_KEY = _make_keys(ZOBRIST_SEED)
+# Key change for a disc on sq changing colour.
+FLIP_KEYS = [ZOBRIST[0][sq] ^ ZOBRIST[1][sq] for sq in range(SQUARES)]
+
+
+_board_keys = {SQUARES: (ZOBRIST, FLIP_KEYS)}
+
+
+def board_keys(squares):
+    """ (ZOBRIST, FLIP_KEYS) for a board of that many squares. The 64
+    square keys are the ones above; other sizes get their own, from a
+    seed of their own, and share SIDE_KEY. """
+    if squares not in _board_keys:
+        zobrist = _make_keys(ZOBRIST_SEED + squares, squares)[0]
+        flip_keys = [zobrist[0][sq] ^ zobrist[1][sq]
+                     for sq in range(squares)]
+        _board_keys[squares] = (zobrist, flip_keys)
+    return _board_keys[squares]
+
+
+def hash_position(black, white, player, squares=SQUARES):
+    """ Zobrist key of a position from scratch. """
+    zobrist = board_keys(squares)[0]
+    key = SIDE_KEY if player else 0
+    for player_discs, keys in ((black, zobrist[0]), (white, zobrist[1])):
+        while player_discs:
+            lsb = player_discs & -player_discs
+            key ^= keys[lsb.bit_length() - 1]
+            player_discs ^= lsb
+    return key
+
+
+class TranspositionTable:
+    """ Fixed-size hash table of search results.
+
+    Each slot holds the key, depth, bound type, score and best move of
+    one node in parallel lists, so a probe or store allocates nothing.
+    A slot is overwritten by a result for the same position, by a result
+    from a newer search, or by a result searched at least as deep.
+    """
+
+    def __init__(self, size_mb=DEFAULT_SIZE_MB):
+        entries = max(1, int(size_mb * 1024 * 1024 / ENTRY_BYTES))
+        # Round down to a power of two so the index is a mask.
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.clear()
+
+    def clear(self):
+        self.keys = [0] * self.size
+        self.depths = [-1] * self.size
+        self.flags = [EXACT] * self.size
+        self.scores = [0] * self.size
+        self.moves = [-1] * self.size
+        self.generations = [0] * self.size
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def new_search(self):
+        """ Age every stored entry so the next search may replace them. """
+        self.generation += 1
+
+    def probe(self, key):
+        """ (depth, flag, score, move) stored for key, or None. """
+        self.probes += 1
+        index = key & self.mask
+        if self.keys[index] == key and self.depths[index] >= 0:
+            self.hits += 1
+            return (self.depths[index], self.flags[index],
+                    self.scores[index], self.moves[index])
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self.mask
+        old_depth = self.depths[index]
+        if self.keys[index] != key and old_depth >= 0:
+            if self.generations[index] == self.generation and \
+               depth < old_depth:
+                self.rejected += 1
+                return
+            self.overwrites += 1
+        self.stores += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.flags[index] = flag
+        self.scores[index] = score
+        self.moves[index] = move
+        self.generations[index] = self.generation
+
+    def hit_rate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def stats(self):
+        """ Counters used to size the table. """
+        used = self.size - self.depths.count(-1)
+        return {'size': self.size, 'used': used,
+                'probes': self.probes, 'hits': self.hits,
+                'hit_rate': self.hit_rate(), 'stores': self.stores,
+                'overwrites': self.overwrites, 'rejected': self.rejected}
@@ -0,0 +1,363 @@
+"""Fit the board_value term weights to recorded games.
+
+    python tune.py [--records games.rec] [--target result|discs|search]
+                   [--out weights.json]
+
+Positions are streamed from a records.py file in chunks, and the seven
+board_value terms of a whole chunk are computed at once by
+batch_eval.features, so a run can cover millions of positions. The
+weights are then fitted to one of
+
+    result  the game's result for the player to move (win 1, draw 1/2,
+            loss 0), by logistic regression
+    discs   the final disc difference for the player to move, by least
+            squares
+    search  the value of a search to --depth with the current weights,
+            by least squares (one search per position, so use --limit)
+
+and written as JSON. Load them with weights.load_term_weights, or give
+them to an arena engine as weights=FILE to test them against the current
+ones. The result and disc fits are not in board_value's units, so they
+are scaled to the sum of the absolute values of the current weights;
+only the ratios between terms matter to the search.
+
+With --evaluator patterns, the tables of patterns.py are fitted instead,
+to the final disc difference or to search values, and written as a
+pattern file (by default patterns.bin, which the 'patterns' evaluator
+reads). Search values are converted to discs by the least squares factor
+between them and the final disc differences of the stage; they make much
+better targets than the results of games played by a weak engine, whose
+outcome is decided by mistakes long after the position. Every position
+is used twice, once with the colours swapped, and each stage is fitted
+on its own by conjugate gradients on the ridge-regularised least squares
+problem, with the products by the sparse pattern matrix done by fancy
+indexing and bincount.
+
+Needs NumPy. Only 8 x 8 games are used.
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+import batch_eval
+import bitboard
+import patterns
+from min_max_ai import StateHolder, fixed_depth_search, WIN_SCORE
+from records import RecordReader, RECORD_FILE
+from weights import TERM_WEIGHTS, write_term_weights
+
+TERMS = list(TERM_WEIGHTS)
+DEFAULT_OUT = 'weights.json'
+CHUNK = 65536
+DEFAULT_SEARCH_DEPTH = 4
+NEWTON_STEPS = 25
+# Ridge penalty keeping the logistic fit finite when a term separates the
+# results perfectly.
+RIDGE = 1e-6
+# Ridge penalty of the pattern fit, in positions: an entry seen in few
+# positions stays near zero.
+PATTERN_RIDGE = 4.0
+CG_STEPS = 200
+# Pattern file entries per disc.
+PATTERN_SCALE = 64
+
+
+def read_chunks(path, min_empties=0, max_empties=64, limit=None,
+                chunk=CHUNK):
+    """ Positions of the 8 x 8 games in a record file, in chunks of
+    (blacks, whites, players, own final discs - opp final discs), each a
+    NumPy array. """
+    reader = RecordReader(path)
+    blacks = []
+    whites = []
+    players = []
+    margins = []
+    count = 0
+    try:
+        for n, black, white, player, black_final, white_final in \
+                reader.positions():
+            if n != bitboard.N:
+                continue
+            empties = 64 - bitboard.popcount(black | white)
+            if not min_empties <= empties <= max_empties:
+                continue
+            blacks.append(black)
+            whites.append(white)
+            players.append(player)
+            margin = black_final - white_final
+            margins.append(margin if player == 0 else -margin)
+            count += 1
+            if len(blacks) == chunk or count == limit:
+                yield (np.array(blacks, dtype=np.uint64),
+                       np.array(whites, dtype=np.uint64),
+                       np.array(players, dtype=np.int8),
+                       np.array(margins, dtype=np.float64))
+                blacks = []
+                whites = []
+                players = []
+                margins = []
+                if count == limit:
+                    return
+        if blacks:
+            yield (np.array(blacks, dtype=np.uint64),
+                   np.array(whites, dtype=np.uint64),
+                   np.array(players, dtype=np.int8),
+                   np.array(margins, dtype=np.float64))
+    finally:
+        reader.close()
+
+
+def feature_matrix(blacks, whites, players):
+    """ (N, 7) matrix of the board_value terms, columns in TERMS order. """
+    grids = batch_eval.grids_from_bitboards(blacks, whites)
+    terms = batch_eval.features(grids, players)
+    return np.column_stack([terms[name] for name in TERMS])
+
+
+def pattern_index_matrix(blacks, whites):
+    """ (N, instances) matrix of the pattern table index of every instance
+    (within a stage's table), and the stage of every position. """
+    grids = batch_eval.grids_from_bitboards(blacks, whites)
+    cells = grids.reshape(len(grids), 64).astype(np.int32)
+    columns = []
+    for offset, squares in patterns.INSTANCES:
+        powers = 3 ** np.arange(len(squares), dtype=np.int32)
+        columns.append(cells[:, list(squares)] @ powers + offset)
+    stages = np.array([patterns.stage(discs) for discs in range(65)])
+    return np.column_stack(columns), stages[(cells > 0).sum(axis=1)]
+
+
+def fit_patterns(indices, y, size, ridge=PATTERN_RIDGE, steps=CG_STEPS):
+    """ Table of size entries minimising the squared error of the sum of
+    its entries at each row of indices against y, plus ridge times the
+    squared entries, by conjugate gradients. """
+    rows, width = indices.shape
+    flat = indices.ravel()
+
+    def normal(v):
+        return np.bincount(flat, weights=np.repeat(v[indices].sum(axis=1),
+                                                   width),
+                           minlength=size) + ridge * v
+
+    table = np.zeros(size)
+    residual = np.bincount(flat, weights=np.repeat(y, width),
+                           minlength=size)
+    direction = residual.copy()
+    norm = residual @ residual
+    for step in range(steps):
+        product = normal(direction)
+        alpha = norm / (direction @ product)
+        table += alpha * direction
+        residual -= alpha * product
+        new_norm = residual @ residual
+        if new_norm < 1e-10:
+            break
+        direction = residual + (new_norm / norm) * direction
+        norm = new_norm
+    error = table[indices].sum(axis=1) - y
+    return table, np.sqrt(np.mean(error ** 2))
+
+
+def tune_patterns(path, target='discs', depth=DEFAULT_SEARCH_DEPTH,
+                  limit=None, min_empties=0, max_empties=64, processes=None):
+    """ Pattern tables, one per stage, fitted to the disc margin for black
+    of the games in path, or to search values scaled to discs. """
+    start = time.perf_counter()
+    indices = []
+    stages = []
+    targets = []
+    finals = []
+    pool = multiprocessing.Pool(processes) if target == 'search' else None
+    try:
+        for blacks, whites, players, margins in read_chunks(
+                path, min_empties, max_empties, limit):
+            if target == 'search':
+                values = search_values(pool, blacks, whites, players, depth)
+                keep = np.abs(values) < WIN_SCORE / 2
+                blacks = blacks[keep]
+                whites = whites[keep]
+                players = players[keep]
+                margins = margins[keep]
+                values = np.where(players == 0, values[keep], -values[keep])
+            margins = np.where(players == 0, margins, -margins)
+            for own, other, sign in ((blacks, whites, 1),
+                                     (whites, blacks, -1)):
+                chunk_indices, chunk_stages = pattern_index_matrix(own, other)
+                indices.append(chunk_indices)
+                stages.append(chunk_stages)
+                finals.append(sign * margins)
+                if target == 'search':
+                    targets.append(sign * values)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if not indices:
+        raise ValueError('no 8 x 8 positions in %s' % path)
+    indices = np.concatenate(indices)
+    stages = np.concatenate(stages)
+    finals = np.concatenate(finals)
+    y = np.concatenate(targets) if target == 'search' else finals
+    elapsed = time.perf_counter() - start
+    print('%d positions in %.1f s (%d per second)'
+          % (len(y) // 2, elapsed, len(y) / 2 / elapsed))
+
+    tables = []
+    for stage in range(patterns.STAGES):
+        rows = stages == stage
+        if not rows.any():
+            tables.append(np.zeros(patterns.STAGE_SIZE))
+            continue
+        stage_y = y[rows]
+        if target == 'search':
+            # Search values to discs, by the least squares factor between
+            # them and the final margins.
+            stage_y = stage_y * (stage_y @ finals[rows]) / \
+                max(stage_y @ stage_y, 1e-9)
+        table, rmse = fit_patterns(indices[rows], stage_y,
+                                   patterns.STAGE_SIZE)
+        print('stage %d  positions %8d  rmse %.2f'
+              % (stage, rows.sum(), rmse))
+        tables.append(table)
+    return tables
+
+
+def search_value(task):
+    """ Pool task: value for the player to move of a position searched to
+    depth. """
+    black, white, player, depth = task
+    state = StateHolder(bitboard.to_grid(black, white), player)
+    return fixed_depth_search(state, depth)[1]
+
+
+def search_values(pool, blacks, whites, players, depth):
+    """ search_value of a chunk of positions, computed by pool. """
+    tasks = [(int(b), int(w), int(p), depth)
+             for b, w, p in zip(blacks, whites, players)]
+    return np.array(pool.map(search_value, tasks, chunksize=16))
+
+
+def fit_least_squares(x, y):
+    weights = np.linalg.lstsq(x, y, rcond=None)[0]
+    rmse = np.sqrt(np.mean((x @ weights - y) ** 2))
+    return weights, 'rmse %.3f' % rmse
+
+
+def fit_logistic(x, y):
+    """ Weights w maximising the likelihood of y (between 0 and 1) under
+    P = 1 / (1 + exp(-x w)), by Newton's method on standardized
+    columns. """
+    scale = x.std(axis=0)
+    scale[scale == 0] = 1.0
+    z = x / scale
+    beta = np.zeros(x.shape[1])
+    ridge = RIDGE * len(z) * np.eye(x.shape[1])
+    for step in range(NEWTON_STEPS):
+        p = 1.0 / (1.0 + np.exp(-(z @ beta)))
+        gradient = z.T @ (y - p) - ridge @ beta
+        hessian = (z * (p * (1.0 - p))[:, None]).T @ z + ridge
+        delta = np.linalg.solve(hessian, gradient)
+        beta += delta
+        if np.abs(delta).max() < 1e-8:
+            break
+    p = np.clip(1.0 / (1.0 + np.exp(-(z @ beta))), 1e-12, 1 - 1e-12)
+    loss = -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))
+    decided = y != 0.5
+    accuracy = np.mean((p[decided] > 0.5) == (y[decided] > 0.5)) \
+        if decided.any() else 0.0
+    return beta / scale, 'log loss %.4f  accuracy %.3f' % (loss, accuracy)
+
+
+def tune(path, target='result', depth=DEFAULT_SEARCH_DEPTH, limit=None,
+         min_empties=0, max_empties=64, processes=None):
+    """ Fitted term weights, as a dict, from the games in path. """
+    start = time.perf_counter()
+    features = []
+    targets = []
+    pool = multiprocessing.Pool(processes) if target == 'search' else None
+    try:
+        for blacks, whites, players, margins in read_chunks(
+                path, min_empties, max_empties, limit):
+            features.append(feature_matrix(blacks, whites, players))
+            if target == 'result':
+                targets.append(np.where(margins > 0, 1.0,
+                                        np.where(margins < 0, 0.0, 0.5)))
+            elif target == 'discs':
+                targets.append(margins)
+            else:
+                targets.append(search_values(pool, blacks, whites, players,
+                                             depth))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if not features:
+        raise ValueError('no 8 x 8 positions in %s' % path)
+    x = np.concatenate(features)
+    y = np.concatenate(targets)
+    if target == 'search':
+        # Proven wins and losses are not board_value's to predict.
+        keep = np.abs(y) < WIN_SCORE / 2
+        x = x[keep]
+        y = y[keep]
+    elapsed = time.perf_counter() - start
+    print('%d positions in %.1f s (%d per second)'
+          % (len(x), elapsed, len(x) / elapsed))
+
+    if target == 'result':
+        weights, quality = fit_logistic(x, y)
+    else:
+        weights, quality = fit_least_squares(x, y)
+    if target != 'search':
+        current = sum(abs(value) for value in TERM_WEIGHTS.values())
+        weights *= current / np.abs(weights).sum()
+    print(quality)
+    return {name: float(value) for name, value in zip(TERMS, weights)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fit the board_value term weights to recorded games')
+    parser.add_argument('--records', default=RECORD_FILE)
+    parser.add_argument('--evaluator', default='board_value',
+                        choices=['board_value', 'patterns'])
+    parser.add_argument('--target', default='result',
+                        choices=['result', 'discs', 'search'])
+    parser.add_argument('--depth', type=int, default=DEFAULT_SEARCH_DEPTH,
+                        help='search depth of the search target')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='use at most this many positions')
+    parser.add_argument('--min-empties', type=int, default=0)
+    parser.add_argument('--max-empties', type=int, default=64)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', default=None,
+                        help='output file (default %s, or the pattern '
+                        'file with --evaluator patterns)' % DEFAULT_OUT)
+    args = parser.parse_args()
+
+    if args.evaluator == 'patterns':
+        if args.target == 'result':
+            parser.error('patterns are fitted to --target discs or search')
+        out = args.out or patterns.PATTERN_PATH
+        tables = tune_patterns(args.records, args.target, args.depth,
+                               args.limit, args.min_empties,
+                               args.max_empties, args.processes)
+        patterns.write_patterns(out, tables, PATTERN_SCALE)
+        print('wrote %s' % out)
+        return
+
+    weights = tune(args.records, args.target, args.depth, args.limit,
+                   args.min_empties, args.max_empties, args.processes)
+    for name in TERMS:
+        print('%-16s %12.3f  (now %g)' % (name, weights[name],
+                                           TERM_WEIGHTS[name]))
+    out = args.out or DEFAULT_OUT
+    write_term_weights(weights, out)
+    print('wrote %s' % out)
+
+
+if __name__ == '__main__':
+    main()